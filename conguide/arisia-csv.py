@@ -19,9 +19,13 @@
 """ Read schedule data from a CSV file created by the Zambia database. """
 
 import csv
+import heapq
+import pickle
 import re
+import tempfile
 
-from . import config, participant, session
+from . import config, participant, session, timing
+from .times import Day, Time
 
 sessions = []
 participants = {}
@@ -43,15 +47,65 @@ def csv_reader(fn):
     reader.fieldnames = fieldnames
     return reader
 
-def read(fn):
-    """ Read a CSV file, return a list of sessions and a dict of participants. """
+def _tangled(chname):
+    # True if any name to be changed overlaps (or is part of) another name,
+    # or another name's replacement
+    strings = []
+    for (i, (name, rename)) in enumerate(chname):
+        if not rename:
+            # deleting a name can join what was on either side of it
+            return True
+        strings.append((i, name, True))
+        strings.append((i, rename, False))
+    names = '\n'.join([name for (name, rename) in chname])
+    everything = '\n'.join([s for (i, s, isname) in strings])
+    for (name, rename) in chname:
+        if everything.count(name) > 1 + rename.count(name) or \
+           names.count(rename) > name.count(rename):
+            return True
+    prefixes = {}
+    for (i, s, isname) in strings:
+        for n in range(1, len(s)):
+            prefixes.setdefault(s[:n], []).append((i, isname))
+    for (i, s, isname) in strings:
+        for n in range(1, len(s)):
+            for (j, jsname) in prefixes.get(s[n:], ()):
+                if i != j and (isname or jsname):
+                    return True
+    return False
 
-    global sessions, participants
+def renamer(chname):
+    """ Compile [participant change name] into a function that applies all
+    the renames to a participants string.
 
-    if sessions:
-        return (sessions, participants)
+    The renames are done as if by one str.replace() after another, so they
+    can apply to each other's results. If no name overlaps another name or
+    a replacement, that's the same as a single regex substitution (longest
+    names first), which is what we do. Otherwise, strings that contain any
+    of the names get the replace() calls, and the rest are left alone.
+    """
+    chname = list(chname.items())
+    if not chname:
+        return lambda text: text
+    names = sorted([name for (name, rename) in chname], key=len, reverse=True)
+    pattern = re.compile('|'.join([re.escape(name) for name in names]))
+    if _tangled(chname):
+        def rename(text):
+            if pattern.search(text):
+                for (name, rename) in chname:
+                    text = text.replace(name, rename)
+            return text
+    else:
+        renames = dict(chname)
+        def rename(text):
+            return pattern.sub(lambda m: renames[m.group(0)], text)
+    return rename
+
+def rows(fn):
+    """ Read a CSV file, yield one cleaned-up row (a dict) per session. """
 
     reader = csv_reader(fn)
+    chname = renamer(participant.Participant.chname)
     for row in reader:
         if not config.PY3:
             for key in row:
@@ -64,8 +118,7 @@ def read(fn):
         if row['participants'] and row['participants'] != ' ':
             # chname has to operate on the full participants string
             # because some of the target names have commas in them
-            for k, v in participant.Participant.chname.items():
-                row['participants'] = row['participants'].replace(k, v)
+            row['participants'] = chname(row['participants'])
             mods = []
             partic = re.split(r', ?', row['participants'])
             for i, p in enumerate(partic):
@@ -84,15 +137,28 @@ def read(fn):
             minimal = (k not in ['title', 'description'])
             row[k] = cleanup(row[k], minimal)
 
-        # make a new session from this data
-        s = session.Session(row, participants)
-        # if session is in [session do not print], the instance doesn't get
-        # initialized, and we can drop it (should we explicitly delete it?)
-        if hasattr(s, 'sessionid'):
-            sessions.append(s)
+        yield row
+
+def read(fn):
+    """ Read a CSV file, return a list of sessions and a dict of participants. """
+
+    global sessions, participants
+
+    if sessions:
+        return (sessions, participants)
+
+    with timing.stage('sessions'):
+        for row in rows(fn):
+            # make a new session from this data
+            s = session.Session(row, participants)
+            # if session is in [session do not print], the instance doesn't get
+            # initialized, and we can drop it (should we explicitly delete it?)
+            if hasattr(s, 'sessionid'):
+                sessions.append(s)
 
     # sort
-    sessions = sorted(sessions)
+    with timing.stage('sort'):
+        sessions = sorted(sessions, key=session.sortkey)
 
     # add session index
     for i, s in enumerate(sessions, start=1):
@@ -100,6 +166,127 @@ def read(fn):
 
     return (sessions, participants)
 
+class OrderError(ValueError):
+    """ The input file isn't sorted by day and time. """
+
+def issorted(fn):
+    """ Check (without making sessions) if a CSV file is sorted by day and time. """
+    days = {}
+    prev = None
+    for row in csv_reader(fn):
+        day = cleanup(row['day'], True)
+        # days are ordered by their first appearance
+        day = days.setdefault(Day._DAY_.get(day, day) if len(day) > 3 else day,
+                              len(days))
+        time = Time(cleanup(row['time'], True))
+        key = (day, time.minutes)
+        if prev and key < prev:
+            return False
+        prev = key
+    return True
+
+def detach(slot):
+    # Forget the sessions in a time slot that's already been written,
+    # so they can be garbage-collected.
+    for s in slot:
+        s.time.sessions = []
+        s.room.sessions = []
+        for p in s.participants:
+            p.sessions = []
+
+def spill(run):
+    # write a sorted run of (key, row) to a temp file
+    f = tempfile.TemporaryFile()
+    for item in sorted(run):
+        pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+def unspill(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            f.close()
+            return
+
+def merge(fn, runsize):
+    """ Yield sessions from an unsorted CSV file, in schedule order.
+
+    This is an external merge sort. The first pass makes a session from each
+    row, in file order, so days, rooms and participants are numbered just as
+    read() would number them. It keeps only the row and its sort key, and
+    writes them out in sorted runs of runsize rows. The second pass merges
+    the runs and makes the sessions again.
+    """
+    runs = []
+    run = []
+    for seq, row in enumerate(rows(fn)):
+        saved = dict(row)
+        s = session.Session(row, participants)
+        if not hasattr(s, 'sessionid'):
+            continue
+        run.append((s.sortkey + (seq,), saved))
+        # undo Session.__init__
+        s.time.sessions.pop()
+        s.room.sessions.pop()
+        for p in s.participants:
+            p.sessions.pop()
+        if len(run) >= runsize:
+            runs.append(spill(run))
+            run = []
+    if run:
+        runs.append(spill(run))
+    for day in Day.days:
+        day.time = []
+    session.Session.curday = session.Session.curtime = ('', None)
+
+    for (key, row) in heapq.merge(*[unspill(f) for f in runs]):
+        yield session.Session(row, participants)
+
+def stream(fn, presorted=None, runsize=10000):
+    """ Yield sessions in schedule order, without holding the whole schedule
+    in memory.
+
+    presorted: True if the file is sorted by day and time (raises OrderError
+    if it turns out not to be), False to sort it, None to check first.
+
+    Only one time slot is held at a time. Once it's been consumed, its
+    sessions are dropped from their rooms, times and participants, so this
+    is only good for reports that write the schedule out in order.
+    """
+    if presorted is None:
+        presorted = issorted(fn)
+    if presorted:
+        source = (session.Session(row, participants) for row in rows(fn))
+    else:
+        source = merge(fn, runsize)
+
+    index = 0
+    prev = None
+    slot = []
+    for s in source:
+        if not hasattr(s, 'sessionid'):
+            continue
+        key = s.sortkey[:2]
+        if key != prev:
+            if prev and key < prev:
+                raise OrderError('%s: session %s (%s %s) is out of order' % \
+                                 (fn, s.sessionid, s.time.day, s.time))
+            for s1 in sorted(slot, key=lambda s: s.room.index):
+                index += 1
+                s1.index = index
+                yield s1
+            detach(slot)
+            slot = []
+            prev = key
+        slot.append(s)
+    for s1 in sorted(slot, key=lambda s: s.room.index):
+        index += 1
+        s1.index = index
+        yield s1
+    detach(slot)
+
 def cleanup(field, minimal=False):
     # convert all whitespace (including newlines) to single spaces
     if type(field) is list:
@@ -0,0 +1,708 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" Benchmarks on synthetic data.
+
+| usage: conguide bench [--sessions N] [--rooms N] [--levels N]
+|                       [--participants N] [--days N] [--merges N]
+|                       [--renames N] [--format {csv,xml,both}] [--seed N]
+|                       [--dir DIR] [--repeat N] [--jobs N] [--cache]
+|                       [--results FILE] [--label TEXT]
+|        python -m conguide.bench suite [same options]
+|        python -m conguide.bench xml [--items N] [--dir DIR]
+|        python -m conguide.bench memory [--items N] [--dir DIR] [--against TREE]
+
+suite (conguide bench): Generate a synthetic program, as a Zambia CSV file
+(with a bios file) and as a Grenadine (sasquan-xml) export, with a config
+file for each, made from the sample arisia.cfg or sasquan.cfg with the
+rooms, levels, grid room merges and participant name changes replaced.
+Also write a previous version of the program, for 'changes'. Then run
+every subcommand but 'watch' on each, in its own process, and report wall
+time, cpu time and peak RSS. ('bios', 'all' and 'guidebook' need a bios
+file, so they only run on the CSV program.)
+
+The results are added to a JSON file (bench.json by default), along with
+the parameters, the conguide version and git commit, and the Python
+version. If the file has an earlier run with the same parameters, each
+result is compared with it.
+
+xml: Generate a Grenadine (sasquan-xml) export with N items, and read it
+with the tree and iterparse readers, each in its own process. Reports
+wall time and peak RSS, and checks that both readers got the same sessions.
+
+memory: Generate the same export, read it in a new process, and report the
+memory allocated for the model (Python 3 only, it uses tracemalloc) and the
+size of each Session, Participant and Room. With --against, do the same with
+the conguide package in another tree (e.g. a checkout of an older version),
+to compare.
+"""
+
+import argparse
+import codecs
+import csv
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+WEEK = ['Friday', 'Saturday', 'Sunday', 'Monday', 'Tuesday', 'Wednesday',
+        'Thursday']
+LEVELS = ['Concourse', 'Lobby', 'Mezzanine', 'Conference', 'Galleria',
+          'Tower', 'Garden', 'Plaza']
+ROOMS = ['201A', '201B', '201C', '202A', '202B', '203', '205', '206A',
+         '207', '300A', '300B', '300C', '300D', '301', '302AB', '303A',
+         '303B', '304', '401C', 'Bays 111A', 'Bays 111B', 'Bays 111C',
+         'Conference Theater 110', 'Hall B', 'Hall C - Flex Space']
+TRACKS = ['Literature', 'Science', 'Fandom', 'Gaming', 'Art', 'Music',
+          'Media', 'Costuming', 'Anime', 'Writing', 'Young Adult']
+FORMATS = ['Panel', 'Reading', 'Autographing', 'Kaffee Klatche',
+           'Workshop', 'Concert', 'Presentation']
+TAGS = ['Discworld', 'Fandom', 'Science', 'Writing', 'Art', 'Gaming',
+        'Costuming', 'Film', 'Music', 'Filk', 'YA', 'Space']
+FIRST = ['Ann', 'Bob', 'Carl', 'Dee', 'Eve', 'Jo', 'Kit', 'Leo', 'Max',
+         'Sue', 'Zed', u'Renée']
+LAST = ['Smith', 'Jones', 'Nguyen', 'Brown', "O'Hara", 'Lee', 'Stubbs',
+        'van Helsing', u'Müller']
+WORDS = ['the', 'future', 'of', 'space', 'opera', 'dragons', 'fandom',
+         'writing', 'science', 'fiction', 'fantasy', 'history', 'robots',
+         'magic', 'maps', 'cities', 'ships']
+DURATIONS = [45, 60, 60, 60, 75, 90, 120]
+GAPS = [0, 15, 15, 30, 60]
+
+# sessions run from 9am to 11pm, except that rooms that are merged for the
+# evening are only used separately until 7pm
+OPEN = 9 * 60
+SPLIT = 19 * 60
+CLOSE = 23 * 60
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def sentence(rand, n):
+    return ' '.join([rand.choice(WORDS) for i in range(n)]).capitalize()
+
+def min_rooms(sessions, days):
+    """ Enough rooms for the given number of sessions, with some slack. """
+    per_room = (CLOSE - OPEN) * len(DURATIONS) * len(GAPS) // \
+               (sum(DURATIONS) * len(GAPS) + sum(GAPS) * len(DURATIONS))
+    return max(len(ROOMS), -(-sessions * 3 // (2 * per_room * days)))
+
+class ScaleError(ValueError):
+    """ There isn't room in the schedule for that many sessions. """
+
+class Program(object):
+    """ A synthetic program, to write out in any input format.
+
+    levels: list of (name, pubsname, room names)
+    merges: list of (merged room, [the rooms it combines])
+    participants: list of names, as they should appear in the outputs
+    chname: dict of {name in the input file: name}, for [participant change name]
+    sessions: list of dicts, in sessionid order, with the participants as
+        (name in the input file, True if moderator)
+    """
+
+    def __init__(self, sessions=2000, rooms=None, levels=5, participants=None,
+                 days=4, merges=3, renames=50, seed=0):
+        rand = random.Random(seed)
+        self.days = WEEK[:days]
+        nrooms = rooms or min_rooms(sessions, days)
+        names = ROOMS[:nrooms] + ['Room %d' % i for i in range(len(ROOMS), nrooms)]
+        merges = min(merges, nrooms // 2)
+        self.merges = [('%s/%s' % (names[2 * i], names[2 * i + 1]),
+                        names[2 * i:2 * i + 2]) for i in range(merges)]
+        allrooms = names + [merged for (merged, rooms) in self.merges]
+        levels = max(1, min(levels, nrooms))
+        self.levels = []
+        for i in range(levels):
+            name = LEVELS[i] if i < len(LEVELS) else 'Level %d' % i
+            # a merged room goes on the same level as the rooms it combines
+            rooms = [r for (j, r) in enumerate(names) if j % levels == i] + \
+                    [merged for (merged, rooms) in self.merges
+                     if names.index(rooms[0]) % levels == i]
+            self.levels.append((name, 'L%d' % (i + 1), rooms))
+
+        self.participants = self.names(participants or max(10, sessions * 2 // 5))
+        renamed = rand.sample(self.participants, min(renames, len(self.participants)))
+        self.chname = {}
+        for (i, name) in enumerate(renamed):
+            if i % 2:
+                # a comma, which has to be handled before the participants
+                # string gets split up
+                words = name.split(' ')
+                n = 2 if re.match(r'\w\.$|X\d+$', words[1]) else 1
+                self.chname['%s, %s' % (' '.join(words[n:]), ' '.join(words[:n]))] = name
+            else:
+                self.chname[name.upper()] = name
+        inputname = dict([(name, raw) for (raw, name) in self.chname.items()])
+
+        # every slot that could be filled without a room being double-booked
+        slots = []
+        merged = set([r for (m, rooms) in self.merges for r in rooms])
+        for day in self.days:
+            for room in allrooms:
+                (t, end) = (OPEN, CLOSE)
+                if room in merged:
+                    end = SPLIT
+                elif '/' in room:
+                    t = SPLIT
+                t += rand.choice(GAPS)
+                while t < end:
+                    duration = rand.choice(DURATIONS)
+                    slots.append((day, t, duration, room))
+                    t += duration + rand.choice(GAPS)
+        if sessions > len(slots):
+            raise ScaleError('%d rooms over %d days only have room for %d sessions' % \
+                             (nrooms, days, len(slots)))
+        slots = rand.sample(slots, sessions)
+        # sessionids aren't in time order
+        rand.shuffle(slots)
+
+        self.sessions = []
+        for (i, (day, t, duration, room)) in enumerate(slots):
+            people = []
+            for n in range(rand.choice((0, 1, 2, 3, 3, 4, 4, 5))):
+                # some people are on a lot more panels than others
+                name = self.participants[int(len(self.participants) * rand.random() ** 2)]
+                if name not in people:
+                    people.append(name)
+            people = [(inputname.get(name, name), j == 0 and len(people) > 1 and rand.random() < 0.6)
+                      for (j, name) in enumerate(people)]
+            title = sentence(rand, rand.randint(2, 8))
+            self.sessions.append({
+                'sessionid': str(100 + i), 'day': day, 'time': t,
+                'duration': duration, 'room': room,
+                'track': rand.choice(TRACKS), 'type': rand.choice(FORMATS),
+                'tags': rand.sample(TAGS, rand.randint(0, 3)),
+                'title': title,
+                'description': ' '.join(['%s.' % sentence(rand, rand.randint(5, 25))
+                                         for j in range(rand.randint(1, 4))]),
+                'participants': people})
+        self.rand = rand
+
+    @staticmethod
+    def names(n):
+        # n different names, with middle initials (and then numbers) once
+        # the first and last names run out
+        names = []
+        for i in range(n):
+            (k, j) = divmod(i, len(FIRST) * len(LAST))
+            middle = [] if not k else [chr(ord('A') + k - 1) + '.'] if k <= 26 else ['X%d' % k]
+            names.append(' '.join([FIRST[j % len(FIRST)]] + middle +
+                                  [LAST[j // len(FIRST)]]))
+        return names
+
+    def level(self, room):
+        for (name, pubsname, rooms) in self.levels:
+            if room in rooms:
+                return name
+
+    def previous(self, fraction=0.05):
+        """ Return the sessions as they might have been in the last data pull:
+        some sessions weren't there yet, and some had a different time, room,
+        title or participants.
+        """
+        rand = random.Random(self.rand.random())
+        sessions = []
+        for s in self.sessions:
+            if rand.random() < fraction:
+                # added since then
+                continue
+            if rand.random() < fraction:
+                s = dict(s)
+                change = rand.choice(('time', 'room', 'title', 'participants'))
+                if change == 'time':
+                    s['time'] = rand.choice(range(OPEN, CLOSE, 30))
+                elif change == 'room':
+                    s['room'] = rand.choice(self.sessions)['room']
+                elif change == 'title':
+                    s['title'] = sentence(rand, rand.randint(2, 8))
+                else:
+                    s['participants'] = s['participants'][1:]
+            sessions.append(s)
+        return sessions
+
+def clock(t):
+    # minutes after midnight as 12-hour time, for Zambia
+    (hour, minute) = divmod(t, 60)
+    return '%d:%02d %s' % ((hour - 1) % 12 + 1, minute, 'AM' if hour < 12 else 'PM')
+
+def duration(minutes):
+    (hour, minute) = divmod(minutes, 60)
+    return ' '.join((['%dhr' % hour] if hour else []) + (['%dmin' % minute] if minute else []))
+
+def write_csv(fn, sessions):
+    """ Write sessions as a Zambia CSV file, for arisia-csv. """
+    rows = [['Sessionid', 'Day', 'Time', 'Duration', 'Room', 'Track', 'Type',
+             'Title', 'Description', 'Participants']]
+    for s in sessions:
+        rows.append([s['sessionid'], s['day'], clock(s['time']),
+                     duration(s['duration']), s['room'], s['track'], s['type'],
+                     s['title'], s['description'],
+                     ', '.join([name + (' (m)' if mod else '')
+                                for (name, mod) in s['participants']])])
+    _write_csv(fn, rows)
+
+def write_bios(fn, program):
+    """ Write a Zambia bios file for the participants, for arisia-csv. """
+    rows = [['badgeid', 'pubsname', 'firstname', 'lastname', 'bio']]
+    rand = random.Random(len(program.participants))
+    for (i, name) in enumerate(program.participants, start=1):
+        (first, last) = name.split(' ', 1)
+        # without the middle initial
+        last = re.sub(r'^(\w\.|X\d+) ', '', last)
+        bio = rand.choice(('%s writes %s.', '%s is known for %s.',
+                           'Dr. %s studies %s.')) % \
+            (rand.choice((name, first, last)), sentence(rand, rand.randint(3, 40)).lower())
+        rows.append([str(i), name, first, last, bio])
+    _write_csv(fn, rows)
+
+def _write_csv(fn, rows):
+    if sys.version_info[0] >= 3:
+        with open(fn, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(rows)
+    else:
+        with open(fn, 'wb') as f:
+            csv.writer(f).writerows([[field.encode('utf-8') for field in row]
+                                     for row in rows])
+
+def write_xml(fn, program, sessions=None):
+    """ Write sessions as a Grenadine XML export, for sasquan-xml. """
+    rand = random.Random(len(program.sessions))
+    slots = {}
+    for s in sessions or program.sessions:
+        slots.setdefault((program.days.index(s['day']), s['time']), []).append(s)
+    f = codecs.open(fn, 'w', 'utf-8')
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<program>\n')
+    for (day, t) in sorted(slots):
+        f.write('<time>\n<start><day>%s</day><time>%d:%02d</time></start>\n' % \
+                ((program.days[day],) + divmod(t, 60)))
+        for s in slots[(day, t)]:
+            f.write('<item>\n<room>%s</room>\n<venue>%s</venue>\n<details>\n' % \
+                    (escape(s['room']), program.level(s['room'])))
+            f.write('<reference_number>%s</reference_number>\n' % s['sessionid'])
+            f.write('<duration>%d</duration>\n' % s['duration'])
+            f.write('<format>%s</format>\n' % s['type'])
+            f.write('<tracks><track>%s</track></tracks>\n' % s['track'])
+            f.write('<tags>%s</tags>\n' % ''.join(['<tag>%s</tag>' % t for t in s['tags']]))
+            f.write('<title>%s</title>\n<short_title>%s</short_title>\n' % \
+                    (s['title'], s['title'][:20]))
+            descr = ' '.join(['<p>%s</p>' % p for p in s['description'].split('. ')])
+            f.write('<description>%s</description>\n' % escape(descr))
+            f.write('<short_description>%s</short_description>\n' % escape(descr[:60]))
+            f.write('<people>\n')
+            for (name, mod) in s['participants']:
+                tag = 'moderator' if mod else 'participant'
+                f.write('<%s><name>%s</name><job_title>%s</job_title>'
+                        '<company>Small Press</company></%s>\n' % \
+                        (tag, escape(name), rand.choice(('Author', 'Editor', 'Artist')), tag))
+            f.write('</people>\n</details>\n</item>\n')
+        f.write('</time>\n')
+    f.write('</program>\n')
+    f.close()
+
+# input files for each format: (schedule, previous schedule, bios)
+FILES = {'csv': ('pocketprogram.csv', 'previous.csv', 'PubBio.csv'),
+         'xml': ('program.xml', 'previous.xml', None)}
+
+# sections of the sample config that describe the sample data
+SAMPLE = re.compile(r'(convention|input files|input file importer|backup files|'
+                    r'(level|venue|room) .*|participant change name)$')
+
+def write_cfg(fn, program, format):
+    """ Write a config file for the program: the sample config for the
+    format, with the convention, files, rooms and name changes replaced.
+    """
+    (reader, sample, level) = {'csv': ('arisia-csv', 'arisia.cfg', 'level'),
+                               'xml': ('sasquan-xml', 'sasquan.cfg', 'venue')}[format]
+    (schedule, previous, bios) = FILES[format]
+    lines = []
+    keep = True
+    with codecs.open(os.path.join(os.path.dirname(os.path.abspath(__file__)), sample),
+                     'r', 'utf-8') as f:
+        for line in f:
+            m = re.match(r'\[(.*)\]', line)
+            if m:
+                keep = not SAMPLE.match(m.group(1))
+            if keep:
+                lines.append(line)
+    f = codecs.open(fn, 'w', 'utf-8')
+    f.write('[convention]\nconvention = Benchmark\nstart = 2017-01-13\n')
+    f.write('goh = %s\n\n' % ', '.join(program.participants[:3]))
+    f.write('[input files]\nschedule = %s\n' % schedule)
+    if bios:
+        f.write('bios = %s\n' % bios)
+    f.write('\n[input file importer]\nreader = %s\n\n' % reader)
+    f.write('[backup files]\nfiles = %s\n\n' % ', '.join(filter(None, (schedule, bios))))
+    for (name, pubsname, rooms) in program.levels:
+        f.write('[%s %s]\npubsname = %s\nrooms = %s\n\n' % \
+                (level, name, pubsname, ', '.join(rooms)))
+    for (merged, rooms) in program.merges:
+        f.write('[room %s]\ngrid room = %s\n\n' % (merged, ', '.join(rooms)))
+    if program.chname:
+        f.write('[participant change name]\n')
+        for (name, rename) in sorted(program.chname.items()):
+            f.write('%s = %s\n' % (name, rename))
+        f.write('\n')
+    f.write(''.join(lines))
+    f.close()
+
+def maxrss():
+    # peak RSS of this process, in KB (ru_maxrss is in bytes on macOS)
+    # (POSIX only, so it's imported here rather than with conguide)
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def child(args):
+    """ Read the file in this process, print the results as json. """
+    from . import config, session
+    config.cfgfile = args.cfg
+    config.quiet = True
+    filereader = session.importer()
+    kwargs = {}
+    if args.reader:
+        kwargs['timeslots'] = getattr(filereader, args.reader)
+    base = maxrss()
+    start = time.time()
+    (sessions, participants) = filereader.read(args.file, **kwargs)
+    elapsed = time.time() - start
+    digest = hashlib.md5()
+    for s in sessions:
+        digest.update(('%s|%s|%s|%s|%s|%s\n' % \
+                       (s.sessionid, s.time.day, s.time, s.room.name, s.title,
+                        ','.join([p.name for p in s.participants]))).encode('utf-8'))
+    print(json.dumps({'time': elapsed, 'maxrss': maxrss(), 'base': base,
+                      'sessions': len(sessions), 'digest': digest.hexdigest()}))
+
+def run_child(fn, cfg, reader=None):
+    """ Run child() in a new process, return its results. """
+    cmd = [sys.executable, '-m', 'conguide.bench', 'child', fn, cfg]
+    if reader:
+        cmd += ['--reader', reader]
+    return json.loads(subprocess.check_output(cmd).decode('utf-8'))
+
+# Run with -c in a child process, with the tree under test on PYTHONPATH,
+# so it can only use what every version of conguide has.
+MEMORY = '''
+import gc, hashlib, json, sys, tracemalloc
+from conguide import config, session
+config.cfgfile = sys.argv[2]
+config.quiet = True
+filereader = session.importer()
+tracemalloc.start()
+(sessions, participants) = filereader.read(sys.argv[1])
+gc.collect()
+allocated = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+def size(objs):
+    # bytes per object, including its __dict__ if it has one
+    objs = list(objs)
+    total = sum([sys.getsizeof(o) + (sys.getsizeof(vars(o)) if hasattr(o, '__dict__') else 0)
+                 for o in objs])
+    return total // max(1, len(objs))
+digest = hashlib.md5()
+for s in sessions:
+    digest.update(('%s|%s|%s|%s|%s|%s\\n' % \\
+                   (s.sessionid, s.time.day, s.time, s.room.name, s.title,
+                    ','.join([p.name for p in s.participants]))).encode('utf-8'))
+print(json.dumps({'allocated': allocated, 'sessions': len(sessions),
+                  'participants': len(participants),
+                  'sizes': {'Session': size(sessions),
+                            'Participant': size(participants.values()),
+                            'Room': size(set([s.room for s in sessions]))},
+                  'digest': digest.hexdigest()}))
+'''
+
+def run_memory(fn, cfg, tree, cwd):
+    """ Run MEMORY in a new process on the given tree, return its results. """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(tree)
+    cmd = [sys.executable, '-c', MEMORY, os.path.abspath(fn), os.path.abspath(cfg)]
+    return json.loads(subprocess.check_output(cmd, env=env, cwd=cwd).decode('utf-8'))
+
+def generate(args, dir):
+    """ Write the xml/memory benchmark's program and config into dir. """
+    fn = os.path.join(dir, 'bench-program.xml')
+    cfg = os.path.join(dir, 'bench-sasquan.cfg')
+    program = Program(args.items, seed=args.seed)
+    write_xml(fn, program)
+    write_cfg(cfg, program, 'xml')
+    print('%s: %d items, %.1f MB' % (fn, args.items, os.path.getsize(fn) / 1e6))
+    return (fn, cfg)
+
+def bench_memory(args):
+    (fn, cfg) = generate(args, args.dir)
+    trees = [('this tree', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))]
+    if args.against:
+        trees.append((args.against, args.against))
+    results = []
+    for (label, tree) in trees:
+        r = run_memory(fn, cfg, tree, args.dir)
+        results.append(r)
+        print('%-15s %7.1f MB for %d sessions, %d participants  '
+              'bytes per Session %d, Participant %d, Room %d' % \
+              (label, r['allocated'] / 1e6, r['sessions'], r['participants'],
+               r['sizes']['Session'], r['sizes']['Participant'], r['sizes']['Room']))
+    if len(results) > 1 and results[0]['digest'] != results[1]['digest']:
+        print('error: the trees got different sessions')
+        return 1
+    return 0
+
+def bench_xml(args):
+    (fn, cfg) = generate(args, args.dir)
+    results = {}
+    for reader in ('timeslots_tree', 'timeslots'):
+        results[reader] = r = run_child(fn, cfg, reader)
+        print('%-15s %6.2fs  peak RSS %7.1f MB (%.1f MB over startup)  %d sessions' % \
+              (reader, r['time'], r['maxrss'] / 1024.0,
+               (r['maxrss'] - r['base']) / 1024.0, r['sessions']))
+    if results['timeslots_tree']['digest'] != results['timeslots']['digest']:
+        print('error: the readers got different sessions')
+        return 1
+    return 0
+
+# The suite: (name, command line, True if it needs the bios file), for
+# every subcommand but 'watch' (which never finishes) and 'bench'.
+SUITE = (
+    ('schedule', ['schedule'], False),
+    ('xref', ['xref'], False),
+    ('featured', ['featured'], False),
+    ('tracks', ['tracks'], False),
+    ('grid', ['grid'], False),
+    ('bios', ['bios'], True),
+    ('all', ['all'], True),
+    ('guidebook', ['guidebook'], True),
+    ('count', ['count'], False),
+    ('changes', ['changes', 'PREVIOUS'], False),
+    ('problems', ['problems'], False),
+    # (--debug, so it only says what it would rename)
+    ('backup', ['--debug', 'backup'], False),
+    ('dup', ['dup'], False),
+    ('overnight', ['overnight'], False),
+)
+
+def run_command(cmd, cwd, env, log):
+    """ Run a command, return its exit status, wall and cpu time, and peak
+    RSS (in KB). Without os.wait4 (i.e. off POSIX), cpu and peak RSS are None.
+    """
+    with open(log, 'w') as f:
+        start = time.time()
+        p = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=f, stderr=subprocess.STDOUT)
+        if not hasattr(os, 'wait4'):
+            status = p.wait()
+            return {'status': status, 'wall': time.time() - start,
+                    'cpu': None, 'maxrss': None}
+        # wait4 gets the usage of just this child
+        (pid, status, usage) = os.wait4(p.pid, 0)
+        wall = time.time() - start
+    rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return {'status': os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1,
+            'wall': wall, 'cpu': usage.ru_utime + usage.ru_stime, 'maxrss': rss}
+
+def revision(tree):
+    # the git commit of the tree under test, if it's a git checkout
+    try:
+        with open(os.devnull, 'w') as null:
+            out = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                          cwd=tree, stderr=null)
+        return out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(args):
+    """ Generate the programs, run the suite on them, save the results. """
+    from .__init__ import __version__
+    tree = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    params = dict([(key, getattr(args, key)) for key in
+                   ('sessions', 'rooms', 'levels', 'participants', 'days',
+                    'merges', 'renames', 'seed', 'jobs', 'cache')])
+    try:
+        program = Program(args.sessions, args.rooms, args.levels, args.participants,
+                          args.days, args.merges, args.renames, args.seed)
+    except ScaleError as e:
+        print('error: %s' % e)
+        return 1
+    previous = program.previous()
+    formats = ('csv', 'xml') if args.format == 'both' else (args.format,)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = tree
+    print('%d sessions, %d rooms on %d levels, %d participants, %d days, '
+          '%d merges, %d renames' % \
+          (len(program.sessions), sum([len(rooms) for (n, p, rooms) in program.levels]),
+           len(program.levels), len(program.participants), len(program.days),
+           len(program.merges), len(program.chname)))
+
+    run = {'label': args.label, 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+           'version': __version__, 'commit': revision(tree),
+           'python': '%d.%d.%d' % sys.version_info[:3],
+           'params': params, 'results': {}}
+    failed = 0
+    for format in formats:
+        dir = os.path.join(args.dir, format)
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+        (schedule, prev, bios) = FILES[format]
+        if format == 'csv':
+            write_csv(os.path.join(dir, schedule), program.sessions)
+            write_csv(os.path.join(dir, prev), previous)
+            write_bios(os.path.join(dir, bios), program)
+        else:
+            write_xml(os.path.join(dir, schedule), program)
+            write_xml(os.path.join(dir, prev), program, previous)
+        write_cfg(os.path.join(dir, 'bench.cfg'), program, format)
+
+        base = [sys.executable, '-m', 'conguide.conguide', '-q', '-c', 'bench.cfg']
+        if not args.cache:
+            base.append('--no-cache')
+        results = run['results'][format] = {}
+        for (name, argv, needs_bios) in SUITE:
+            if needs_bios and not bios:
+                continue
+            argv = [prev if arg == 'PREVIOUS' else arg for arg in argv]
+            if name == 'all' and args.jobs > 1:
+                argv += ['--jobs', str(args.jobs)]
+            log = os.path.join(dir, name + '.log')
+            runs = [run_command(base + argv, dir, env, log) for i in range(args.repeat)]
+            r = results[name] = min(runs, key=lambda r: r['wall'])
+            if r['status']:
+                failed += 1
+            print('%s %-10s %7.2fs  cpu %8s  peak RSS %10s%s' % \
+                  (format, name, r['wall'],
+                   'n/a' if r['cpu'] is None else '%7.2fs' % r['cpu'],
+                   'n/a' if r['maxrss'] is None else '%7.1f MB' % (r['maxrss'] / 1024.0),
+                   '  FAILED (see %s)' % log if r['status'] else ''))
+
+    runs = []
+    if os.path.exists(args.results):
+        with open(args.results) as f:
+            runs = json.load(f)
+    earlier = [r for r in runs if r['params'] == params and r['python'] == run['python']]
+    if earlier:
+        compare(earlier[-1], run)
+    runs.append(run)
+    with open(args.results, 'w') as f:
+        json.dump(runs, f, indent=1, sort_keys=True)
+    print('results added to %s' % args.results)
+    return 1 if failed else 0
+
+def compare(old, new):
+    """ Print the change in each result since an earlier run. """
+    print('\ncompared with %s (%s):' % (old['commit'] or old['version'], old['date']))
+    for format in sorted(new['results']):
+        for (name, argv, needs_bios) in SUITE:
+            (r0, r1) = (old['results'].get(format, {}).get(name),
+                        new['results'][format].get(name))
+            if not r0 or not r1 or r0['status'] or r1['status']:
+                continue
+            print('%s %-10s wall %7s  cpu %7s  peak RSS %7s' % \
+                  (format, name, change(r0['wall'], r1['wall']),
+                   change(r0['cpu'], r1['cpu']), change(r0['maxrss'], r1['maxrss'])))
+    print('')
+
+def change(old, new):
+    # as a percentage, or n/a if either run had no usage data
+    if old is None or new is None:
+        return 'n/a'
+    return '%+6.1f%%' % (100.0 * (new - old) / old if old else 0.0)
+
+def add_suite_args(parser):
+    parser.add_argument('--sessions', type=int, metavar='N', default=2000,
+                        help='number of sessions (default 2000)')
+    parser.add_argument('--rooms', type=int, metavar='N',
+                        help='number of rooms, not counting merged rooms '
+                        '(default: enough for the sessions)')
+    parser.add_argument('--levels', type=int, metavar='N', default=5,
+                        help='number of levels (venues) (default 5)')
+    parser.add_argument('--participants', type=int, metavar='N',
+                        help='number of participants (default 2 for every 5 sessions)')
+    parser.add_argument('--days', type=int, metavar='N', default=4, choices=range(1, len(WEEK) + 1),
+                        help='number of days (default 4)')
+    parser.add_argument('--merges', type=int, metavar='N', default=3,
+                        help='number of pairs of rooms that are merged in the evening, '
+                        'with a [room] grid room (default 3)')
+    parser.add_argument('--renames', type=int, metavar='N', default=50,
+                        help='number of [participant change name] entries (default 50)')
+    parser.add_argument('--format', choices=('csv', 'xml', 'both'), default='both',
+                        help='input format: Zambia csv, Grenadine xml, or both (default both)')
+    parser.add_argument('--seed', type=int, metavar='N', default=0,
+                        help='random seed for the synthetic data')
+    parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'conguide-bench'),
+                        help='where to write the synthetic data and outputs')
+    parser.add_argument('--repeat', type=int, default=1, metavar='N',
+                        help='run each command N times, and keep the fastest')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='run \'all\' with --jobs N')
+    parser.add_argument('--cache', action='store_true',
+                        help='let the commands use the parsed schedule cache')
+    parser.add_argument('--results', default='bench.json', metavar='FILE',
+                        help='JSON file to add the results to (default bench.json)')
+    parser.add_argument('--label', default='',
+                        help='a note to save with the results')
+
+def add_args(subparsers):
+    parser = subparsers.add_parser('bench', add_help=False,
+                                   help='benchmark all commands on synthetic data')
+    # -h is html everywhere else
+    parser.add_argument('-?', '--help', action='help',
+                        help='show this help message and exit')
+    add_suite_args(parser)
+    parser.set_defaults(func=main, reads_input=False)
+
+def main(args):
+    if bench_suite(args):
+        sys.exit(1)
+
+def command_line():
+    parser = argparse.ArgumentParser(prog='python -m conguide.bench')
+    subparsers = parser.add_subparsers(dest='bench')
+    p = subparsers.add_parser('suite', help='run all commands on synthetic data')
+    add_suite_args(p)
+    p.set_defaults(func=bench_suite)
+    p = subparsers.add_parser('xml', help='compare the sasquan-xml readers')
+    p.add_argument('--items', type=int, default=2000,
+                   help='number of program items (default 2000)')
+    p.add_argument('--seed', type=int, default=0,
+                   help='random seed for the synthetic data')
+    p.add_argument('--dir', default=tempfile.gettempdir(),
+                   help='where to write the synthetic data')
+    p.set_defaults(func=bench_xml)
+    p = subparsers.add_parser('memory', help='measure the memory used by the model')
+    p.add_argument('--items', type=int, default=2000,
+                   help='number of program items (default 2000)')
+    p.add_argument('--seed', type=int, default=0,
+                   help='random seed for the synthetic data')
+    p.add_argument('--dir', default=tempfile.gettempdir(),
+                   help='where to write the synthetic data')
+    p.add_argument('--against', metavar='TREE',
+                   help='also measure the conguide package in TREE')
+    p.set_defaults(func=bench_memory)
+    p = subparsers.add_parser('child')
+    p.add_argument('file')
+    p.add_argument('cfg')
+    p.add_argument('--reader')
+    p.set_defaults(func=child)
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(command_line())
@@ -19,7 +19,7 @@
 import copy
 import re
 
-from . import parserhelp, config, output, participant, session
+from . import parserhelp, config, output, participant, session, timing
 
 class Output(output.Output):
 
@@ -172,9 +172,9 @@ class HtmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -228,10 +228,9 @@ class XmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</bios>\n')
-        if not self.leaveopen:
-            Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -246,7 +245,7 @@ class XmlOutput(Output):
         return '<bio>%s</bio>' % text
 
 def write(output, participants):
-    for p in sorted(participants.values()):
+    for p in sorted(participants.values(), key=participant.sortkey):
         output.f.write(output.strBioEntry(p))
 
 def add_args(subparsers):
@@ -256,20 +255,28 @@ def add_args(subparsers):
     parserhelp.add_io(parser)
     parser.set_defaults(func=main)
 
+# output modes supported by this report
+modes = ('text', 'html', 'xml')
+
+@timing.timed('bios')
+def render(args, model, mode):
+    """ Write one output mode of the participant bios. """
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.participants)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'bios')) as out:
+                write(out, model.participants)
+        except config.NoOptionError:
+            pass
+
 def main(args):
-    (sessions, participants) = session.read(config.get('input files', 'schedule'))
-    fn = args.infile or config.get('input files', 'bios')
-    participant.read(fn, participants)
+    model = session.read_model()
+    model.read_bios(args.infile)
     if args.all or (args.text + args.html + args.xml == 0):
         args.text = args.html = args.xml = True
-    for mode in ('text', 'html', 'xml'):
+    for mode in modes:
         if eval('args.' + mode):
-            outfunc = eval('%sOutput' % mode.capitalize())
-            if args.outfile:
-                write(outfunc(args.outfile), participants)
-            else:
-                try:
-                    write(outfunc(config.get('output files ' + mode, 'bios')),
-                          participants)
-                except config.NoOptionError:
-                    pass
+            render(args, model, mode)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" On-disk snapshots of the parsed schedule.
+
+Reading the schedule file means parsing it and applying all the
+[session change ...] and [participant change ...] rewrites. The result
+(sessions, participants, rooms, levels, days, and the track, type and tag
+names) is pickled into the .conguide directory, so the next run on the same
+input can load it instead.
+
+A snapshot is keyed on the input file (size, mtime and contents), the
+config file contents, the importer, and the source of the modules that
+build the model, so it's discarded as soon as any of them change. There is
+one snapshot per input file; a stale one just gets overwritten.
+
+Warnings printed while parsing are saved with the snapshot, and printed
+again when it's loaded.
+
+Computed participant sortkeys are saved with the snapshot too, and are
+reused even when the rest of it is stale, as long as participant.py hasn't
+changed.
+
+Sessions and participants all refer to each other, so pickling them as
+they are would recurse once for every link in the chain, and crash on a
+big enough program. Instead, each one is pickled as a dict of its
+attributes, with any session or participant in them replaced by its
+position in the list, and load() links them up again.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from . import config, timing
+from .participant import Participant
+from .session import Session
+from .room import Level, Place, Room
+from .times import Day
+from .__init__ import __version__
+
+# where the snapshots go
+DIR = config.cachedir
+
+# bump this if the snapshot layout changes
+FORMAT = 5
+
+def _digest(fn, h=None):
+    # hash a file's contents
+    h = h or hashlib.sha1()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h
+
+def _source(module):
+    # the .py file for a module, not the .pyc
+    fn = module.__file__
+    if fn.endswith(('.pyc', '.pyo')):
+        fn = fn[:-1]
+    return fn
+
+def key(fn, filereader):
+    """ Return the cache key for reading fn with filereader. """
+    from . import participant, room, session, times
+    h = hashlib.sha1()
+    st = os.stat(fn)
+    h.update(repr((FORMAT, __version__, sys.version_info[:2],
+                   os.path.abspath(fn), st.st_size, st.st_mtime,
+                   filereader.__name__,
+                   # what got printed while parsing
+                   config.debug, config.quiet)).encode('utf-8'))
+    _digest(fn, h)
+    _digest(config.cfgfile, h)
+    for module in (filereader, session, participant, room, times):
+        _digest(_source(module), h)
+    return h.hexdigest()
+
+def _sortkeys_tag():
+    # what the computed participant sortkeys depend on
+    from . import participant
+    return (FORMAT, _digest(_source(participant)).hexdigest())
+
+def path(fn):
+    """ Return the snapshot file name for input file fn. """
+    name = hashlib.sha1(os.path.abspath(fn).encode('utf-8')).hexdigest()
+    return os.path.join(DIR, name + '.pickle')
+
+def fresh(filereader):
+    """ True if nothing has been read yet in this process.
+
+    A snapshot replaces the room, level and day registries wholesale, so it
+    can only be used (or saved) if they haven't been populated yet.
+    """
+    return not (filereader.sessions or Day.days or 'levels' in vars(Level))
+
+class Recorder(object):
+    """ Pass writes through to stdout, and keep a copy. """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.text = []
+
+    def write(self, text):
+        self.text.append(text)
+        self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _slots(obj, skip=()):
+    # an object's attributes, by name
+    state = {}
+    for name in type(obj).__slots__:
+        if name not in skip and hasattr(obj, name):
+            state[name] = getattr(obj, name)
+    return state
+
+class _Pickler(pickle.Pickler):
+    """ Pickle sessions and participants as ('s', i) and ('p', i), their
+    positions in the lists, so the pickler doesn't follow them.
+    """
+
+    def __init__(self, f, sessions, participants):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.ids = {}
+        for (i, s) in enumerate(sessions):
+            self.ids[id(s)] = ('s', i)
+        for (i, p) in enumerate(participants):
+            self.ids[id(p)] = ('p', i)
+
+    def persistent_id(self, obj):
+        return self.ids.get(id(obj))
+
+class _Unpickler(pickle.Unpickler):
+    """ Turn ('s', i) and ('p', i) back into (empty) sessions and
+    participants, for restore() to fill in.
+    """
+
+    def __init__(self, f, objects):
+        pickle.Unpickler.__init__(self, f)
+        self.objects = objects
+
+    def persistent_load(self, pid):
+        return self.objects[pid[0]][pid[1]]
+
+def dump(f, sessions, participants, extra=None):
+    """ Pickle the model, and the registries, to f (see restore()). """
+    from . import session
+    people = list(participants.values())
+    pickle.dump((len(sessions), list(participants)), f, pickle.HIGHEST_PROTOCOL)
+    # moderatorset is a set of participants, so it can't be made until
+    # they're filled in
+    state = ([_slots(s, ('moderatorset',)) for s in sessions],
+             [_slots(p) for p in people],
+             getattr(Level, 'levels', {}), getattr(Room, 'rooms', {}), Day.days,
+             (Level.count, Room.count, Day.index),
+             (session.tracks, session.types, session.tags), extra)
+    _Pickler(f, sessions, people).dump(state)
+
+def restore(f):
+    """ Unpickle a model from dump(), and restore the registries and the
+    session name tables. Returns (sessions, participants, extra).
+    """
+    from . import session
+    (nsessions, names) = pickle.load(f)
+    sessions = [Session.__new__(Session) for i in range(nsessions)]
+    people = [Participant.__new__(Participant) for name in names]
+    (sstates, pstates, levels, rooms, days, indexes, tables, extra) = \
+        _Unpickler(f, {'s': sessions, 'p': people}).load()
+    for (p, state) in zip(people, pstates):
+        for (name, value) in state.items():
+            setattr(p, name, value)
+    for (s, state) in zip(sessions, sstates):
+        for (name, value) in state.items():
+            setattr(s, name, value)
+        s.moderatorset = frozenset(s.moderators)
+    participants = dict(zip(names, people))
+    (session.tracks, session.types, session.tags) = tables
+    Place._readconfig = lambda x: None
+    Level.levels = levels
+    Room.rooms = rooms
+    Day.days[:] = days
+    (Level.count, Room.count, Day.index) = indexes
+    return (sessions, participants, extra)
+
+def load(fn, filereader):
+    """ Load the snapshot for fn, if there is a current one.
+
+    Restores the registries and the importer's globals, replays the
+    warnings, and returns (sessions, participants), or None.
+    """
+    try:
+        k = key(fn, filereader)
+        with open(path(fn), 'rb') as f:
+            current = (pickle.load(f) == k)
+            (tag, sortkeys) = pickle.load(f)
+            if tag == _sortkeys_tag():
+                Participant.sortkeys.update(sortkeys)
+            if not current:
+                return None
+            (sessions, participants, text) = restore(f)
+    except Exception as e:
+        # missing, stale or unreadable; just read the input file
+        if config.debug and not isinstance(e, (IOError, OSError)):
+            print('info: ignoring cache for %s: %s' % (fn, e))
+        return None
+
+    filereader.sessions = sessions
+    filereader.participants = participants
+    if config.debug:
+        print('info: read %s from cache' % fn)
+    sys.stdout.write(''.join(text))
+    return (sessions, participants)
+
+def save(fn, filereader, sessions, participants, text):
+    """ Save a snapshot of the model just read from fn. If that fails, say
+    so, and carry on without it.
+    """
+    tmp = None
+    try:
+        k = key(fn, filereader)
+        if not os.path.isdir(DIR):
+            os.mkdir(DIR)
+        (fd, tmp) = tempfile.mkstemp(dir=DIR)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(k, f, pickle.HIGHEST_PROTOCOL)
+            # only the participants in this model, so renamed and removed
+            # ones don't pile up from run to run
+            sortkeys = dict([(p.name, Participant.sortkeys[p.name])
+                             for p in participants.values()
+                             if p.name in Participant.sortkeys])
+            pickle.dump((_sortkeys_tag(), sortkeys), f, pickle.HIGHEST_PROTOCOL)
+            dump(f, sessions, participants, text)
+        # atomic, so a concurrent run never sees half a snapshot
+        os.rename(tmp, path(fn))
+    except Exception as e:
+        if not config.quiet:
+            print('warning: could not cache %s: %s' % (fn, e))
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+def read(fn, filereader):
+    """ Read fn with filereader, through the cache. """
+    if not config.cache or not fresh(filereader):
+        return filereader.read(fn)
+    with timing.stage('cache'):
+        result = load(fn, filereader)
+    if result:
+        return result
+    stdout = sys.stdout
+    sys.stdout = Recorder(stdout)
+    try:
+        (sessions, participants) = filereader.read(fn)
+    finally:
+        text = sys.stdout.text
+        sys.stdout = stdout
+    save(fn, filereader, sessions, participants, text)
+    return (sessions, participants)
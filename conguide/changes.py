@@ -23,6 +23,15 @@ from . import config, session
 if not config.PY3:
     str = unicode
 
+def compare(old, new):
+    """ Compare two dicts (e.g. of sessions by sessionid), return lists of
+    the keys that were added, removed, and changed.
+    """
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = [k for k in new if k in old and new[k] != old[k]]
+    return (added, removed, changed)
+
 def changes(args):
     if len(args.files) == 1:
         args.files.append(config.get('input files', 'schedule'))
@@ -62,16 +71,18 @@ def changes(args):
     ch_description = []
     ch_participants = []
     
-    for s in sorted(sessions[1].values()):
-        if not s.sessionid in sessions[0]:
-            if args.verbose:
-                new.append('%s:\n\t%s {%s}' % \
-                           (session_header(s), s.description,
-                            ', '.join(map(str, s.participants))))
-            else:
-                new.append(session_header(s))
+    (added, removed, unused) = compare(sessions[0], sessions[1])
+
+    for s in sorted([sessions[1][sessionid] for sessionid in added],
+                    key=session.sortkey):
+        if args.verbose:
+            new.append('%s:\n\t%s {%s}' % \
+                       (session_header(s), s.description,
+                        ', '.join(map(str, s.participants))))
+        else:
+            new.append(session_header(s))
     
-    for s in sorted(sessions[0].values()):
+    for s in sorted(sessions[0].values(), key=session.sortkey):
         sh = session_header(s)
         if config.debug:
             print(sh)
@@ -100,28 +111,18 @@ def changes(args):
                 ch_description.append(sh)
         cp = []
         if s1.participants != s.participants:
-            add = []
-            for p in s1.participants:
-                if not p in s.participants:
-                    add.append(str(p))
+            # set lookups, but report them in session order
+            (p0, p1) = (set(s.participants), set(s1.participants))
+            add = [str(p) for p in s1.participants if p not in p0]
             if add:
                 cp.append('add %s' % ', '.join(add))
-            remove = []
-            for p in s.participants:
-                if not p in s1.participants:
-                    remove.append(str(p))
+            remove = [str(p) for p in s.participants if p not in p1]
             if remove:
                 cp.append('remove %s' % ', '.join(remove))
-            addmod = []
-            for p in s1.moderators:
-                if not p in s.moderators:
-                    addmod.append(str(p))
+            addmod = [str(p) for p in s1.moderators if p not in s.moderatorset]
             if addmod:
                 cp.append('add moderator %s' % ', '.join(addmod))
-            removemod = []
-            for p in s.moderators:
-                if not p in s1.moderators:
-                    removemod.append(str(p))
+            removemod = [str(p) for p in s.moderators if p not in s1.moderatorset]
             if removemod:
                 cp.append('remove moderator %s' % ', '.join(removemod))
         if cp:
@@ -185,11 +186,11 @@ def changes_bios(args):
             string += ' (%s)' % p.name
         return string
 
-    for p in sorted(participants[1].values()):
+    for p in sorted(participants[1].values(), key=participant.sortkey):
         if not p.badgeid in participants[0]:
             added.append(pheader(p))
 
-    for p in sorted(participants[0].values()):
+    for p in sorted(participants[0].values(), key=participant.sortkey):
         ph = pheader(p)
         if args.debug:
             print(ph)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" Session predicates and classifiers from config file expressions.
+
+Expressions like those in [tracks classifier] or [schedule icons], e.g.
+
+    (track == 'Art' and type != 'Panel')
+    (sessionid in combat or room == 'Otis')
+    title.startswith(('Doors Open ', 'Door Open '))
+
+are parsed once into Python functions of a session. Supported are
+'==', '!=', 'in', 'not in', startswith() and endswith() on the session
+fields below, combined with 'and', 'or', 'not' and parentheses. 'in' takes
+a tuple or list of strings, or the name of a list supplied by the caller.
+
+Predicates that only look at track, type, room and level are memoized on
+those fields, so with a few hundred sessions and a few dozen tracks, most
+classifications are a dict lookup.
+"""
+
+import re
+
+from . import config
+
+# session fields, by expression name
+fields = {
+    'track': lambda session: session.track,
+    'type': lambda session: session.type,
+    'room': lambda session: session.room.name,
+    'level': lambda session: session.room.level.name if session.room.level else None,
+    'sessionid': lambda session: session.sessionid,
+    'title': lambda session: session.title,
+}
+
+# fields with few enough distinct values to memoize on
+categorical = frozenset(('track', 'type', 'room', 'level'))
+
+_token = re.compile(r'''\s*(?:(==|!=|[(),.\[\]])|('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(\w+))''')
+
+def predicate(func, fields):
+    """ Mark a function(session) with the names of the fields it uses. """
+    func.fields = frozenset(fields)
+    return func
+
+def key(names):
+    """ Return a function(session) that returns the memo key for the
+    given fields.
+    """
+    getters = tuple([fields[name] for name in sorted(names)])
+    if len(getters) == 1:
+        return getters[0]
+    return lambda session: tuple([get(session) for get in getters])
+
+def memoize(pred):
+    """ Memoize a predicate on its fields, if they're all categorical. """
+    if not pred.fields or not (pred.fields <= categorical):
+        return pred
+    getkey = key(pred.fields)
+    memo = {}
+    def memoized(session):
+        k = getkey(session)
+        try:
+            return memo[k]
+        except KeyError:
+            memo[k] = value = pred(session)
+            return value
+    return predicate(memoized, pred.fields)
+
+class Parser(object):
+    """ Recursive-descent parser for one expression. """
+
+    def __init__(self, expr, names):
+        self.expr = expr
+        self.names = names or {}
+        self.tokens = []
+        pos = 0
+        expr = expr.rstrip()
+        while pos < len(expr):
+            m = _token.match(expr, pos)
+            if not m:
+                self.error('unexpected %r' % expr[pos:].strip()[0])
+            (op, string, word) = m.groups()
+            if string:
+                self.tokens.append(('string', re.sub(r'\\(.)', r'\1', string[1:-1])))
+            elif word:
+                self.tokens.append(('word', word))
+            else:
+                self.tokens.append(('op', op))
+            pos = m.end()
+        self.pos = 0
+
+    def error(self, msg):
+        raise ValueError('%s in expression: %s' % (msg, self.expr))
+
+    def peek(self, kind=None, value=None):
+        try:
+            (k, v) = self.tokens[self.pos]
+        except IndexError:
+            return False
+        return (kind is None or k == kind) and (value is None or v == value)
+
+    def take(self, kind=None, value=None):
+        if not self.peek(kind, value):
+            if self.pos < len(self.tokens):
+                self.error('unexpected %r' % self.tokens[self.pos][1])
+            else:
+                self.error('unexpected end')
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def parse(self):
+        pred = self.disjunction()
+        if self.pos < len(self.tokens):
+            self.error('unexpected %r' % self.tokens[self.pos][1])
+        return pred
+
+    def disjunction(self):
+        preds = [self.conjunction()]
+        while self.peek('word', 'or'):
+            self.take()
+            preds.append(self.conjunction())
+        if len(preds) == 1:
+            return preds[0]
+        preds = tuple(preds)
+        def either(session):
+            for pred in preds:
+                if pred(session):
+                    return True
+            return False
+        return predicate(either, set().union(*[p.fields for p in preds]))
+
+    def conjunction(self):
+        preds = [self.negation()]
+        while self.peek('word', 'and'):
+            self.take()
+            preds.append(self.negation())
+        if len(preds) == 1:
+            return preds[0]
+        preds = tuple(preds)
+        def both(session):
+            for pred in preds:
+                if not pred(session):
+                    return False
+            return True
+        return predicate(both, set().union(*[p.fields for p in preds]))
+
+    def negation(self):
+        if self.peek('word', 'not'):
+            self.take()
+            pred = self.negation()
+            return predicate(lambda session: not pred(session), pred.fields)
+        return self.atom()
+
+    def atom(self):
+        if self.peek('op', '('):
+            self.take()
+            pred = self.disjunction()
+            self.take('op', ')')
+            return pred
+
+        name = self.take('word')
+        try:
+            get = fields[name]
+        except KeyError:
+            self.error('unknown field %r' % name)
+
+        if self.peek('op', '.'):
+            self.take()
+            method = self.take('word')
+            if method not in ('startswith', 'endswith'):
+                self.error('unknown method %r' % method)
+            self.take('op', '(')
+            values = self.strings(')')
+            self.take('op', ')')
+            if method == 'startswith':
+                func = lambda session: get(session).startswith(values)
+            else:
+                func = lambda session: get(session).endswith(values)
+            return predicate(func, (name,))
+
+        if self.peek('op', '=='):
+            self.take()
+            value = self.take('string')
+            return predicate(lambda session: get(session) == value, (name,))
+        if self.peek('op', '!='):
+            self.take()
+            value = self.take('string')
+            return predicate(lambda session: get(session) != value, (name,))
+
+        negate = False
+        if self.peek('word', 'not'):
+            self.take()
+            negate = True
+        self.take('word', 'in')
+        values = self.collection()
+        if negate:
+            func = lambda session: get(session) not in values
+        else:
+            func = lambda session: get(session) in values
+        return predicate(func, (name,))
+
+    def collection(self):
+        # a named list, or a literal tuple or list of strings
+        if self.peek('word'):
+            name = self.take()
+            try:
+                return frozenset(self.names[name])
+            except KeyError:
+                self.error('unknown list %r' % name)
+        if self.peek('op', '['):
+            self.take()
+            values = self.strings(']')
+            self.take('op', ']')
+        else:
+            self.take('op', '(')
+            values = self.strings(')')
+            self.take('op', ')')
+        return frozenset(values)
+
+    def strings(self, close):
+        # comma-separated strings, optionally in their own parentheses
+        if self.peek('op', '('):
+            self.take()
+            values = self.strings(')')
+            self.take('op', ')')
+            return values
+        values = []
+        while not self.peek('op', close):
+            values.append(self.take('string'))
+            if not self.peek('op', close):
+                self.take('op', ',')
+        return tuple(values)
+
+class Predicate(object):
+    """ A compiled expression, callable on a session.
+
+    (This is an object rather than a plain function so it can be kept as a
+    class attribute, e.g. Output.prune, without becoming a method.)
+    """
+
+    def __init__(self, expr, names=None):
+        self.expr = expr
+        self.func = memoize(Parser(expr, names).parse())
+        self.fields = self.func.fields
+
+    def __call__(self, session):
+        return self.func(session)
+
+def compile(expr, names=None):
+    """ Compile an expression into a Predicate.
+
+    names is a dict of lists that can be used on the right side of 'in'.
+    Raises ValueError if the expression can't be parsed.
+    """
+    return Predicate(expr, names)
+
+class Classifier(object):
+    """ An ordered list of (label, predicate) rules.
+
+    Calling the classifier on a session returns the label of the first
+    rule that matches, or the default.
+    """
+
+    def __init__(self, rules, names=None):
+        self.rules = []
+        for label, expr in rules:
+            self.rules.append((label, compile(expr, names).func))
+        used = set().union(*[pred.fields for (label, pred) in self.rules])
+        if self.rules and used <= categorical:
+            # memoize the whole classification
+            self.key = key(used)
+        else:
+            # memoize the rules individually (done by compile())
+            self.key = None
+        self.memo = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def classify(self, session):
+        for label, pred in self.rules:
+            if pred(session):
+                return label
+        return None
+
+    def __call__(self, session, default=None):
+        if self.key:
+            k = self.key(session)
+            try:
+                label = self.memo[k]
+            except KeyError:
+                label = self.memo[k] = self.classify(session)
+        else:
+            label = self.classify(session)
+        return default if label is None else label
+
+def read(section, names=None):
+    """ Read a config section of 'label = expression' rules. """
+    try:
+        rules = config.items(section)
+    except config.NoSectionError:
+        rules = []
+    return Classifier(rules, names)
@@ -18,6 +18,7 @@
 
 """ Global variables and config file parsing. """
 
+import os
 import re
 import sys
 PY3 = sys.version > '3'
@@ -36,6 +37,10 @@ CFG = 'conguide.cfg'
 debug = False
 quiet = False
 cfgfile = CFG
+# use the parsed schedule cache (see cache.py)
+cache = True
+# where the caches go, relative to the working directory
+cachedir = '.conguide'
 
 # bios.py variables
 boldnames = {}
@@ -90,7 +95,22 @@ else:
                 list[i] = (name, value)
             return list
 
+# The config file is parsed once, into a tuple of (name, value) items and
+# a dict of values for each section, and lookups are served from those.
+# The parsed form is saved in .conguide/ (see cache.py), keyed on the config
+# file's size and mtime, so the next run doesn't need ConfigParser at all.
+# A value that ConfigParser can't resolve (e.g. a bad %-interpolation) is
+# left to ConfigParser, so it raises the same error as always.
+
 cfg = None
+# (sections, {section: items}, {section: {option: value}})
+parsed = None
+# memoized getboolean() and getfloat() results
+typed = {}
+
+class Unresolved(object):
+    """ Stands in for a section's items or an option's value that
+    ConfigParser couldn't resolve. """
 
 def readConfig(fn):
     global cfg
@@ -106,7 +126,101 @@ def readConfig(fn):
             with codecs.open(fn, 'r', 'utf-8') as f:
                 cfg.readfp(f)
 
+def resolve(section):
+    """ Return the items and the values of one section, from ConfigParser. """
+    try:
+        items = tuple(cfg.items(section))
+    except Exception:
+        items = Unresolved
+    values = {}
+    for option in cfg.options(section):
+        try:
+            values[option] = cfg.get(section, option)
+        except Exception:
+            values[option] = Unresolved
+    return (items, values)
+
+def parse(fn):
+    """ Return the parsed form of a config file. """
+    readConfig(fn)
+    sections = cfg.sections()
+    items = {}
+    values = {}
+    for section in sections:
+        (items[section], values[section]) = resolve(section)
+    return (sections, items, values)
+
+def cachefile(fn):
+    # where the parsed form of fn is saved, and what it's keyed on
+    import hashlib
+    fn = os.path.abspath(fn)
+    st = os.stat(fn)
+    key = (1, sys.version_info[:2], fn, st.st_size, st.st_mtime,
+           os.path.getmtime(__file__))
+    name = hashlib.sha1(fn.encode('utf-8')).hexdigest()
+    return (os.path.join(cachedir, 'config-%s.pickle' % name), key)
+
+def load():
+    """ Parse the config file, or load its parsed form, if that's not done yet. """
+    global parsed
+    if parsed is not None:
+        return
+    if not cache:
+        parsed = parse(cfgfile)
+        return
+    import pickle
+    (path, key) = cachefile(cfgfile)
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) == key:
+                parsed = pickle.load(f)
+                return
+    except Exception:
+        pass
+    parsed = parse(cfgfile)
+    import tempfile
+    tmp = None
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.mkdir(os.path.dirname(path))
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(parsed, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except (IOError, OSError, pickle.PicklingError) as e:
+        if debug:
+            print('info: could not cache %s: %s' % (cfgfile, e))
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+def reset():
+    """ Forget the config file, so it's read again. """
+    global cfg, parsed
+    cfg = None
+    parsed = None
+    typed.clear()
+
+def lookup(table, section):
+    # a section's items or values, Unresolved to ask ConfigParser,
+    # or NoSectionError
+    load()
+    try:
+        return parsed[table][section]
+    except KeyError:
+        if section == configparser.DEFAULTSECT:
+            return Unresolved
+        raise NoSectionError(configparser.NoSectionError(section))
+
 def get(section, option):
+    values = lookup(2, section)
+    if values is not Unresolved:
+        try:
+            value = values[option]
+        except KeyError:
+            raise NoOptionError(configparser.NoOptionError(option, section))
+        if value is not Unresolved:
+            return value
     readConfig(cfgfile)
     try:
         return cfg.get(section, option)
@@ -115,25 +229,32 @@ def get(section, option):
     except configparser.NoOptionError as e:
         raise NoOptionError(e)
 
+# ConfigParser's boolean strings
+booleans = getattr(configparser.RawConfigParser, 'BOOLEAN_STATES', None) or \
+           configparser.RawConfigParser._boolean_states
+
 def getboolean(section, option):
-    readConfig(cfgfile)
     try:
-        return cfg.getboolean(section, option)
-    except configparser.NoSectionError as e:
-        raise NoSectionError(e)
-    except configparser.NoOptionError as e:
-        raise NoOptionError(e)
+        return typed[('boolean', section, option)]
+    except KeyError:
+        pass
+    value = get(section, option)
+    if value.lower() not in booleans:
+        raise ValueError('Not a boolean: %s' % value)
+    typed[('boolean', section, option)] = booleans[value.lower()]
+    return booleans[value.lower()]
 
 def getfloat(section, option):
-    readConfig(cfgfile)
     try:
-        return cfg.getfloat(section, option)
-    except configparser.NoSectionError as e:
-        raise NoSectionError(e)
-    except configparser.NoOptionError as e:
-        raise NoOptionError(e)
+        return typed[('float', section, option)]
+    except KeyError:
+        typed[('float', section, option)] = value = float(get(section, option))
+        return value
 
 def items(section):
+    items = lookup(1, section)
+    if items is not Unresolved:
+        return list(items)
     readConfig(cfgfile)
     try:
         return cfg.items(section)
@@ -141,25 +262,22 @@ def items(section):
         raise NoSectionError(e)
 
 def itemdict(section):
-    readConfig(cfgfile)
-    try:
-        dd = {}
-        for key, value in cfg.items(section):
-            dd[key] = value
-        return dd
-    except configparser.NoSectionError as e:
-        raise NoSectionError(e)
+    return dict(items(section))
 
 def sections():
-    readConfig(cfgfile)
-    return cfg.sections()
+    load()
+    return list(parsed[0])
 
 def set(section, option, value):
+    global parsed
     readConfig(cfgfile)
     try:
         cfg.set(section, option, value)
     except configparser.NoSectionError as e:
         raise NoSectionError(e)
+    # this can change any section (through [DEFAULT] or interpolation)
+    parsed = parse(cfgfile)
+    typed.clear()
 
 # exception classes, so callers don't have to know about configparser
 # (or ConfigParser)
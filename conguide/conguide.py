@@ -37,44 +37,251 @@ cross-reference (xref), featured sessions, and track list.
 """
 
 import argparse
-import codecs
+import importlib
 import os
 import sys
 import time
 
-from . import config, bios, featured, grid, output, participant, schedule, session, \
-    tracks, xref, guidebook, count, changes, problems, backup, dup, overnight, \
-    parserhelp
+from . import config, parserhelp, timing
 from .__init__ import __prog__, __version__
 
 # search the working directory for [input file importer]
 sys.path[0:0] = '.'
 
+# Subcommands, in the order they're listed by --help: (name, help). Each one
+# is implemented by the module of the same name, except 'all', which is
+# below. Only the module for the subcommand being run gets imported; the
+# rest just get a placeholder subparser, for --help.
+commands = (
+    ('schedule', 'generate the "TV Guide" style listing'),
+    ('xref', 'generate the program participant index'),
+    ('featured', 'generate the "featured event" listing'),
+    ('tracks', 'generate the index by track or area'),
+    ('grid', 'generate the daily grids'),
+    ('bios', 'generate the program participant bios'),
+    ('all', 'generate all reports'),
+    ('watch', 'rebuild all reports whenever the input files change'),
+    ('guidebook', 'generate the csv files for Guidebook'),
+    ('count', 'count sessions, rooms, etc.'),
+    ('changes', 'compare data snapshots'),
+    ('problems', 'find common problems in the data file'),
+    ('backup', 'back up important files'),
+    ('dup', 'find duplicate sessions'),
+    ('overnight', 'find overnight sessions'),
+    ('bench', 'benchmark all commands on synthetic data'),
+)
+
+# reports generated by 'all', in order
+reports = ('schedule', 'xref', 'featured', 'tracks', 'grid', 'bios')
+
+def module(name):
+    """ Import the module for a subcommand or report. """
+    return importlib.import_module('.' + name, __package__)
+
+def write_conguide(args, model):
+    # all of the xml reports in one file
+    from . import featured, output, schedule, tracks, xref
+    try:
+        fn = config.get('output files xml', 'conguide')
+    except (config.NoSectionError, config.NoOptionError):
+        return
+    schedule.configure(args, model)
+    with output.Sink(fn, 'utf-8', 'replace') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<conguide>\n')
+        for (report, data) in ((schedule, model.sessions),
+                               (featured, model.sessions),
+                               (tracks, model.sessions),
+                               (xref, model.participants)):
+            with report.XmlOutput(None, f) as out:
+                report.write(out, data)
+        f.write('</conguide>\n')
+
+def render_job(job):
+    # Render one (report, mode) pair, in a worker or the main process.
+    # Return its timing, the files it staged, and the traceback if it
+    # failed, so a failure anywhere can keep all of the outputs out.
+    from . import output
+    (name, mode) = job
+    if output.staged is None:
+        # a spawned worker
+        output.stage()
+    before = len(output.staged)
+    mark = timing.mark()
+    start = time.time()
+    try:
+        if name == 'conguide':
+            with timing.stage('conguide xml'):
+                write_conguide(_args, _model)
+        else:
+            module(name).render(_args, _model, mode)
+        error = None
+    except Exception:
+        import traceback
+        error = traceback.format_exc()
+    return (name, mode, os.getpid(), time.time() - start,
+            output.staged[before:], error, timing.since(mark))
+
+def _snapshot(model):
+    # the model, flattened for a spawned worker (see cache.dump)
+    import io
+    from . import cache
+    f = io.BytesIO()
+    cache.dump(f, model.sessions, model.participants, model.bios)
+    return f.getvalue()
+
+def _init_worker(args, model, state, snapshot=None):
+    # Worker initializer. With fork, the model is inherited from the parent;
+    # with spawn, it arrives as a snapshot, which also puts back the
+    # class-level registries. The global settings have to be put back too.
+    global _args, _model
+    _args = args
+    (config.debug, config.quiet, config.cfgfile, config.source_date) = state
+    if snapshot is None:
+        _model = model
+        return
+    import io
+    from . import cache, session
+    (sessions, participants, bios) = cache.restore(io.BytesIO(snapshot))
+    _model = session.Model(sessions, participants)
+    _model.bios = bios
+
+def parallel_reports(args, model, jobs):
+    # render the reports in a pool of args.jobs worker processes
+    import multiprocessing
+    try:
+        ctx = multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        # py2 (always forks on posix), or no fork on this platform
+        ctx = getattr(multiprocessing, 'get_context', lambda: multiprocessing)()
+    state = (config.debug, config.quiet, config.cfgfile, config.source_date)
+    if getattr(ctx, 'get_start_method', lambda: 'fork')() == 'fork':
+        initargs = (args, model, state)
+    else:
+        # Pickling the model as it is would follow every link between
+        # sessions and participants, and could overflow the stack, so send
+        # it flattened, as the cache does.
+        initargs = (args, None, state, _snapshot(model))
+    start = time.time()
+    pool = ctx.Pool(args.jobs, _init_worker, initargs)
+    try:
+        with timing.stage('render -j %d' % args.jobs):
+            results = pool.map(render_job, jobs, chunksize=1)
+            # the workers' stages ran in parallel, as part of this one
+            for result in results:
+                timing.adopt(result[6])
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+
+    if not config.quiet and not [r for r in results if r[5]]:
+        workers = {}
+        for (name, mode, pid, t, files, error, stages) in results:
+            if config.debug:
+                print('%s %s: %.2fs (pid %d)' % (name, mode, t, pid))
+            (n, total) = workers.get(pid, (0, 0.0))
+            workers[pid] = (n + 1, total + t)
+        for pid in sorted(workers):
+            (n, total) = workers[pid]
+            print('worker %d: %d outputs, %.2fs' % (pid, n, total))
+        busy = sum([total for (n, total) in workers.values()])
+        print('%d outputs in %.2fs on %d workers (%.2fs busy)' % \
+              (len(results), elapsed, args.jobs, busy))
+    return results
+
+def finish(results):
+    """ Move the staged outputs into place if every report succeeded, and
+    report what was written; otherwise remove them all, and fail.
+    """
+    from . import output
+    files = []
+    for (name, mode, pid, t, staged, error, stages) in results:
+        files += staged
+    failed = [r for r in results if r[5]]
+    if failed:
+        output.discard(files)
+        for (name, mode, pid, t, staged, error, stages) in failed:
+            sys.stderr.write('%s %s failed:\n%s' % (name, mode, error))
+        sys.exit('no outputs written, %d of %d reports failed' % \
+                 (len(failed), len(results)))
+    output.commit(files)
+    if not config.quiet:
+        for (name, mode, pid, t, staged, error, stages) in results:
+            for (tmp, fn, size) in staged:
+                print('%s %s: %s, %d bytes, %.2fs' % (name, mode, fn, size, t))
+
 def all_reports(args):
-    # generate all reports
-    if args.text + args.html + args.indesign + args.xml == 0:
+    # generate all reports from a single reading of the input files
+    from . import incremental, session
+    if args.all or (args.text + args.html + args.indesign + args.xml == 0):
         args.text = args.html = args.indesign = args.xml = True
-    schedule.main(args)
-    xref.main(args)
-    featured.main(args)
-    tracks.main(args)
-    grid.main(args)
-    bios.main(args)
+    model = session.read_model(args.infile)
+    model.read_bios()
+    jobs = []
+    with timing.stage('import reports'):
+        for name in reports:
+            for mode in module(name).modes:
+                if getattr(args, mode):
+                    jobs.append((name, mode))
     if args.xml:
-        try:
-            f = codecs.open(config.get('output files xml', 'conguide'),
-                            'w', 'utf-8', 'replace')
-        except KeyError:
-            pass
+        jobs.append(('conguide', 'xml'))
+    if args.incremental:
+        (todo, manifest) = incremental.outdated(args, model, jobs)
+    else:
+        todo = jobs
+    # every output is staged, and only goes into place if all succeed
+    from . import output
+    output.stage()
+    try:
+        if args.jobs > 1 and len(todo) > 1:
+            results = parallel_reports(args, model, todo)
         else:
-            (sessions, participants) = session.read(config.get('input files', 'schedule'))
-            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<conguide>\n')
-            schedule.write(schedule.XmlOutput(None, f), sessions)
-            featured.write(featured.XmlOutput(None, f), sessions)
-            tracks.write(tracks.XmlOutput(None, f), sessions)
-            xref.write(xref.XmlOutput(None, f), participants)
-            f.write('</conguide>\n')
-            f.close()
+            global _args, _model
+            (_args, _model) = (args, model)
+            results = []
+            for job in todo:
+                results.append(render_job(job))
+                if results[-1][5]:
+                    break
+    except BaseException:
+        output.discard(output.unstage())
+        raise
+    output.unstage()
+    finish(results)
+    if args.incremental:
+        incremental.save(jobs, manifest)
+
+def add_all(subparsers, help):
+    # all of the reports at once
+    parser_all = subparsers.add_parser('all', add_help=False, help=help)
+    parserhelp.add_modes(parser_all, ['t', 'h', 'x', 'i', 'a'])
+    parserhelp.add_io(parser_all)
+    parser_all.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                            metavar='N',
+                            help='render reports in N parallel processes')
+    parser_all.add_argument('--incremental', action='store_true',
+                            help='only render the reports affected by changes since the last run')
+    parser_all.set_defaults(func=all_reports)
+
+# global options that take a value
+valued = ('-c', '--config', '--profile-stats', '--profile-stacks')
+
+def command(argv):
+    """ Return the subcommand in a command line, without parsing it: the
+    first word that isn't a global option or an option's value.
+    """
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        # (an abbreviation, unless it's all of --profile)
+        if arg in valued or (len(arg) >= 3 and arg != '--profile' and
+                             [opt for opt in valued if opt.startswith(arg)]):
+            i += 2
+        elif arg.startswith('-'):
+            i += 1
+        else:
+            return arg
+    return None
 
 def main():
     # command line
@@ -92,30 +299,26 @@ def main():
                         help='add debugging/trace information')
     parser.add_argument('-q', '--quiet', action='store_true',
                         help='suppress warning messages')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='don\'t use (or save) the parsed schedule cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='print wall and cpu time for each stage of the run')
+    parser.add_argument('--profile-stats', metavar='FILE',
+                        help='--profile, and save cProfile stats (for pstats) to FILE')
+    parser.add_argument('--profile-stacks', metavar='FILE',
+                        help='--profile, and save the stages as collapsed stacks (for flamegraph.pl) to FILE')
  
-    # subcommand-specific options
-    schedule.add_args(subparsers)
-    xref.add_args(subparsers)
-    featured.add_args(subparsers)
-    tracks.add_args(subparsers)
-    grid.add_args(subparsers)
-    bios.add_args(subparsers)
-
-    # all of the previous reports at once
-    parser_all = subparsers.add_parser('all', add_help=False,
-                                        help='generate all reports')
-    parserhelp.add_modes(parser_all, ['t', 'h', 'x', 'i', 'a'])
-    parserhelp.add_io(parser_all)
-    parser_all.set_defaults(func=all_reports)
-
-    # more subcommands
-    guidebook.add_args(subparsers)
-    count.add_args(subparsers)
-    changes.add_args(subparsers)
-    problems.add_args(subparsers)
-    backup.add_args(subparsers)
-    dup.add_args(subparsers)
-    overnight.add_args(subparsers)
+    # subcommand-specific options, for the one being run
+    (start, cstart) = (time.time(), timing.cpu())
+    name = command(sys.argv[1:])
+    with timing.stage('import'):
+        for (cmd, help) in commands:
+            if cmd == 'all':
+                add_all(subparsers, help)
+            elif cmd == name:
+                module(cmd).add_args(subparsers)
+            else:
+                subparsers.add_parser(cmd, help=help)
 
     # parse that command line
     args = parser.parse_args()
@@ -123,15 +326,37 @@ def main():
     config.debug = args.debug
     config.quiet = args.quiet
     config.cfgfile = args.cfg
+    config.cache = args.cache
 
+    args.profile = args.profile or bool(args.profile_stats or args.profile_stacks)
+    profiler = None
+    if args.profile_stats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
     try:
-        fn = args.infile or config.get('input files', 'schedule')
-    except AttributeError:
-        fn = config.get('input files', 'schedule')
-    config.source_date = time.ctime(os.path.getmtime(fn))
+        # (except for commands that make their own input, like bench)
+        if getattr(args, 'reads_input', True):
+            with timing.stage('config'):
+                config.load()
+            try:
+                fn = args.infile or config.get('input files', 'schedule')
+            except AttributeError:
+                fn = config.get('input files', 'schedule')
+            config.source_date = time.ctime(os.path.getmtime(fn))
 
-    # run the subcommand
-    args.func(args)
+        # run the subcommand
+        args.func(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_stats)
+        if args.profile:
+            total = (time.time() - start, timing.cpu() - cstart)
+            timing.report(sys.stdout, total)
+            if args.profile_stacks:
+                with open(args.profile_stacks, 'w') as f:
+                    timing.stacks(f, name or 'all', total[0])
 
 if __name__ == '__main__':
     sys.exit(main())
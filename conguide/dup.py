@@ -58,10 +58,10 @@ def main(args):
 
     if dup_t:
         print('# by title')
-        for s in sorted(dup_t):
+        for s in sorted(dup_t, key=session.sortkey):
             print('%s = %s\t# %s (%d)' % (s.sessionid, title[s.title].sessionid, s.title, len(s.description)))
 
     if dup_d:
         print('# by description')
-        for s in sorted(dup_d):
+        for s in sorted(dup_d, key=session.sortkey):
             print('%s = %s\t# %s (%d)' % (s.sessionid, descr[s.description].sessionid, s.title, len(s.description)))
@@ -19,7 +19,8 @@
 import copy
 import re
 
-from . import parserhelp, config, output, session
+from . import parserhelp, config, output, session, timing
+from .classifier import Classifier
 
 class Output(output.Output):
 
@@ -86,9 +87,9 @@ class HtmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -115,10 +116,9 @@ class XmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</featured>\n')
-        if not self.leaveopen:
-            Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -178,20 +178,35 @@ def add_args(subparsers):
                                  help='identify likely candidates for "featured" list')
     parser.set_defaults(func=main)
 
+# output modes supported by this report
+modes = ('text', 'html', 'xml')
+
+@timing.timed('featured')
+def render(args, model, mode):
+    """ Write one output mode of the featured events listing. """
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.sessions)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'featured')) as out:
+                write(out, model.sessions)
+        except config.NoOptionError:
+            pass
+
 def main(args):
     def research(sessions):
         # research - list all sessions in major-draw tracks, plus all sessions
         # with at least one GOH participant, formatted for cut-and-paste into
         # arisia.cfg. Note this is just a starting point, and often misses
         # things like the Masquerade.
-        research = []
         try:
-            for unused, expr in config.items('featured research'):
-                expr = expr.replace('track', 'session.track')
-                expr = expr.replace('type', 'session.type')
-                research.append(expr)
+            research = [expr for (unused, expr) in config.items('featured research')]
         except config.NoSectionError:
             return
+        # label each rule with its index
+        classify = Classifier(enumerate(research))
         goh = {}
         for name in re.split(r',\s*', config.get('convention', 'goh')):
             goh[name] = True
@@ -207,34 +222,24 @@ def main(args):
         gohpartic = []
         ss = {}
         for session in sessions:
-            for i, expr in enumerate(research):
-                if eval(expr):
-                    try:
-                        ss[i].append(session)
-                    except KeyError:
-                        ss[i] = [session]
-                    break
+            i = classify(session)
+            if i is not None:
+                try:
+                    ss[i].append(session)
+                except KeyError:
+                    ss[i] = [session]
             if is_goh(session):
                 gohpartic.append(session)
         for i in sorted(ss):
             out('### %s' % research[i], ss[i])
         out("### GOH participant(s)", gohpartic)
 
-    fn = args.infile or config.get('input files', 'schedule')
-    (sessions, participants) = session.read(fn)
+    model = session.read_model(args.infile)
     if args.all or (args.text + args.html + args.xml == 0):
         args.text = args.html = args.xml = True
     if hasattr(args, 'research') and args.research:
-        research(sessions)
+        research(model.sessions)
     else:
-        for mode in ('text', 'html', 'xml'):
+        for mode in modes:
             if eval('args.' + mode):
-                outfunc = eval('%sOutput' % mode.capitalize())
-                if args.outfile:
-                    write(outfunc(args.outfile), sessions)
-                else:
-                    try:
-                        write(outfunc(config.get('output files ' + mode, 'featured')),
-                              sessions)
-                    except config.NoOptionError:
-                        pass
+                render(args, model, mode)
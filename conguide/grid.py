@@ -18,8 +18,9 @@
 
 import copy
 import re
+from array import array
 
-from . import parserhelp, config, output, session
+from . import parserhelp, classifier, config, output, session, timing
 from .room import Level, Room
 from .times import Day, Time, Duration
 
@@ -61,15 +62,15 @@ class Output(output.Output):
         exprs = []
         try:
             expr = config.get('grid no print', 'title starts with')
-            exprs.append('session.title.startswith((%s))' % expr)
+            exprs.append('title.startswith((%s))' % expr)
         except (config.NoSectionError, config.NoOptionError):
             pass
         try:
             expr = config.get('grid no print', 'title ends with')
-            exprs.append('session.title.endswith((%s))' % expr)
+            exprs.append('title.endswith((%s))' % expr)
         except (config.NoSectionError, config.NoOptionError):
             pass
-        Output.noprint = ' or '.join(exprs)
+        Output.noprint = classifier.compile(' or '.join(exprs)) if exprs else None
 
         try:
             val = config.get('grid title prune', 'usage')
@@ -145,9 +146,9 @@ class HtmlOutput(Output):
             self.fixed = False
         self.configSlice()
 
-    def __del__(self):
+    def close(self):
         self.f.write('</body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         text = Output.cleanup(self, text)
@@ -440,9 +441,9 @@ class XmlOutput(Output):
             pass
         self.configSlice()
 
-    def __del__(self):
+    def close(self):
         self.f.write('</Story></Root>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         text = Output.cleanup(self, text)
@@ -517,10 +518,7 @@ class XmlOutput(Output):
 def write(output, unused=None):
 
     def activeRoom(room, start, end):
-        for i in range(start, end):
-            if room.gridrow[i]:
-                return True
-        return False
+        return any(room.gridrow[start:end])
 
     def activeGrid(gridslice):
         for room in gridslice.rooms:
@@ -528,9 +526,6 @@ def write(output, unused=None):
                 return True
         return False
 
-    def offset(time):
-        return (time.day.index * 24 * 2) + (time.hour * 2) + int((time.minute + 15) / 30)
-
     def writeTable(gridslice):
         output.f.write(output.strTableTitle(gridslice))
         output.f.write(output.strTableStart(gridslice))
@@ -543,15 +538,15 @@ def write(output, unused=None):
         output.f.write(output.strHeaderRowStart())
         output.f.write(output.strRowHeaderCell(''))
         time = gridslice.start
-        half = Duration('30min')
         while time < gridslice.end:
             output.f.write(output.strTableHeaderCell(time.__str__(mode='grid')))
-            time += half
+            time += HALF_HOUR
         output.f.write(output.strRowEnd())
 
     def writeTableRow(gridslice, i):
         room = gridslice.rooms[i]
         row = room.gridrow
+        above = gridslice.rooms[i-1].gridrow if i > 0 else None
         output.f.write(output.strRowStart())
         try:
             rname = output.fillTemplate(output.template['room'], room.gridsessions[0])
@@ -560,10 +555,9 @@ def write(output, unused=None):
         output.f.write(output.strRowHeaderCell(rname, room))
         j = gridslice.startIndex
         while j < gridslice.endIndex:
-            ncol = colspan(gridslice, i, j)
+            ncol = min(room.gridrun[j], gridslice.endIndex - j)
             # if this session was previously listed in an adjacent room, skip
-            if row[j] and (i > 0) and \
-               (gridslice.rooms[i-1].gridrow[j] == row[j]):
+            if row[j] and above and above[j] == row[j]:
                 for k in range(ncol):
                     output.f.write(output.strCellBehind())
             else:
@@ -574,7 +568,7 @@ def write(output, unused=None):
 
     def writeSessions(gridslice, i, j, nrow, ncol):
         room = gridslice.rooms[i]
-        sessions = room.gridrow[j]
+        sessions = groups[room.gridrow[j]]
         if not sessions:
             output.f.write(output.strGrayCell(ncol))
         else:
@@ -593,17 +587,11 @@ def write(output, unused=None):
                 titles.append(title)
             output.f.write(output.strTextCell(nrow, ncol, '; '.join(titles), room))
 
-    def colspan(gridslice, i, j):
-        row = gridslice.rooms[i].gridrow
-        k = j + 1
-        while k < gridslice.endIndex and row[k] == row[j]:
-            k += 1
-        return k - j
-
     def rowspan(gridslice, i, j):
+        rooms = gridslice.rooms
+        group = rooms[i].gridrow[j]
         k = i + 1
-        while k < len(gridslice.rooms) and \
-              gridslice.rooms[k].gridrow[j] == gridslice.rooms[i].gridrow[j]:
+        while k < len(rooms) and rooms[k].gridrow[j] == group:
             k += 1
         return k - i
 
@@ -622,6 +610,89 @@ def write(output, unused=None):
             if activeGrid(gridslice):
                 writeTable(gridslice)
 
+HALF_HOUR = Duration('30min')
+
+def offset(time):
+    # index of the half-hour block a time falls in
+    return (time.day.index * 24 * 2) + (time.minutes + 15) // 30
+
+def extent(session):
+    """ Return the first and last+1 half-hour blocks the session covers. """
+    off = offset(session.time)
+    end = (session.time.day.index * 24 * 2) + \
+          (session.time.minutes + session.duration.minutes + 15) // 30
+    if off == end:
+        # This is a short session, where start and end round to
+        # the same time. This can happen for a few reasons,
+        # outlined below.
+        startmin = session.time.minute
+        endmin = startmin + session.duration.minute
+
+        # a) If the session is less than 15 minutes, and falls
+        # entirely in the first half of the slot (e.g. 4:00-4:10),
+        # we need to push out the end time.
+        if startmin < 15 or \
+           startmin >= 30 and startmin < 45:
+            end += 1
+
+        # b) If the session is less than 15 minutes, and falls
+        # entirely in the second half of the slot (e.g. 4:20-4:30),
+        # we need to pull back the start time.
+        elif endmin >= 15 and endmin <= 30 or \
+             endmin >= 45 and endmin <= 60:
+            off -= 1
+
+        # c) If the session is less than 30 minutes, and crosses
+        # an hour or half-hour boundary, we need to figure out
+        # which slot it's more "in".
+        else:
+            if startmin < 30:
+                # session crosses a half-hour boundary
+                before = 30 - startmin
+                after = endmin - 30
+            else:
+                # session crosses an hour boundary
+                before = 60 - startmin
+                after = endmin - 60
+            if before > after:
+                off -= 1
+            else:
+                end += 1
+        # Note: This doesn't account for all short sessions.
+        # If a session is less than 30 minutes, but crosses a
+        # 15-minute mark (e.g. 4:05-4:25), start and end get
+        # rounded in different directions, and it's handled the
+        # same as a half-hour session.
+    return (off, end)
+
+# The grid is an array per room of half-hour blocks (room.gridrow), each
+# holding an index into groups, the table of distinct cell contents.
+# Group 0 is the empty cell. Cells with the same sessions get the same
+# group, so comparing cells is comparing ints.
+groups = [[]]
+_group = {(): 0}
+
+def group(sessions):
+    # intern a cell's list of sessions
+    k = tuple([id(s) for s in sessions])
+    try:
+        return _group[k]
+    except KeyError:
+        _group[k] = g = len(groups)
+        groups.append(sessions)
+        return g
+
+def runs(row):
+    """ For each block in a grid row, the number of blocks from there
+    that hold the same group.
+    """
+    run = array('i', row)
+    n = 0
+    for j in range(len(row) - 1, -1, -1):
+        n = n + 1 if j + 1 < len(row) and row[j + 1] == row[j] else 1
+        run[j] = n
+    return run
+
 matrix_done = False
 def matrix():
     global matrix_done
@@ -629,9 +700,6 @@ def matrix():
         return
     matrix_done = True
 
-    def offset(time):
-        return (time.day.index * 24 * 2) + (time.hour * 2) + int((time.minute + 15) / 30)
-
     # two passes to set up gridsessions:
     # first, atomic rooms that are not subdivided, that will have a row in the grid
     for room in filter(lambda room: not hasattr(room, 'gridrooms'), Room.rooms.values()):
@@ -644,76 +712,44 @@ def matrix():
             r.gridsessions += room.sessions
         room.gridsessions = []
 
+    nblocks = (len(Day.days) + 1) * 24 * 2
+    empty = array('i', [0]) * nblocks
     for room in Room.rooms.values():
-        # declare an array of half-hour blocks
-        room.gridrow = [None for j in range((len(Day.days) + 1) * 24 * 2)]
+        # config doesn't get read until we instantiate an output class.
+        # [grid no print] items can screw with counts for "major" rooms.
+        ##if output.noprint and output.noprint(session):
+        ##    if output.name == 'xml' or output.name == 'indesign':
+        ##        continue
+        ##    else:
+        ##        # XXX more local policy
+        ##        # XXX may also screw up anything else using session data after this
+        ##        session.duration = Duration('30min')
+        row = array('i', empty)
         for session in room.gridsessions:
-            # config doesn't get read until we instantiate an output class.
-            # [grid no print] items can screw with counts for "major" rooms.
-            ##if output.noprint and eval(output.noprint):
-            ##    if output.name == 'xml' or output.name == 'indesign':
-            ##        continue
-            ##    else:
-            ##        # XXX more local policy
-            ##        # XXX may also screw up anything else using session data after this
-            ##        session.duration = Duration('30min')
-            off = offset(session.time)
-            end = offset(session.time + session.duration)
-            if off == end:
-                # This is a short session, where start and end round to
-                # the same time. This can happen for a few reasons,
-                # outlined below.
-                startmin = session.time.minute
-                endmin = startmin + session.duration.minute
-
-                # a) If the session is less than 15 minutes, and falls
-                # entirely in the first half of the slot (e.g. 4:00-4:10),
-                # we need to push out the end time.
-                if startmin < 15 or \
-                   startmin >= 30 and startmin < 45:
-                    end += 1
-
-                # b) If the session is less than 15 minutes, and falls
-                # entirely in the second half of the slot (e.g. 4:20-4:30),
-                # we need to pull back the start time.
-                elif endmin >= 15 and endmin <= 30 or \
-                     endmin >= 45 and endmin <= 60:
-                    off -= 1
-
-                # c) If the session is less than 30 minutes, and crosses
-                # an hour or half-hour boundary, we need to figure out
-                # which slot it's more "in".
-                else:
-                    if startmin < 30:
-                        # session crosses a half-hour boundary
-                        before = 30 - startmin
-                        after = endmin - 30
-                    else:
-                        # session crosses an hour boundary
-                        before = 60 - startmin
-                        after = endmin - 60
-                    if before > after:
-                        off -= 1
-                    else:
-                        end += 1
-                # Note: This doesn't account for all short sessions.
-                # If a session is less than 30 minutes, but crosses a
-                # 15-minute mark (e.g. 4:05-4:25), start and end get
-                # rounded in different directions, and it's handled the
-                # same as a half-hour session.
-
-            while off < min(end, len(room.gridrow)):
-                try:
-                    # two sessions share the same cell
-                    # iff they start at the same time
-                    if session.time - room.gridrow[off][0].time < Duration('30min'):
-                        room.gridrow[off].append(session)
-                    else:
-                        room.gridrow[off] = [session]
-                    #room.gridrow[off].append(session)
-                except (TypeError, AttributeError):
-                    room.gridrow[off] = [session]
-                off += 1
+            (off, end) = extent(session)
+            end = min(end, nblocks)
+            if off >= end:
+                continue
+            single = group([session])
+            if not any(row[off:end]):
+                row[off:end] = array('i', [single]) * (end - off)
+                continue
+            # some blocks are already taken
+            hour = session.time.hour
+            minute = session.time.minute
+            for j in range(off, end):
+                g = row[j]
+                if g:
+                    # two sessions share the same cell iff they start
+                    # within half an hour (by the clock) of each other
+                    first = groups[g][0].time
+                    dh = hour - first.hour
+                    if dh < 0 or dh == 0 and minute - first.minute < 30:
+                        row[j] = group(groups[g] + [session])
+                        continue
+                row[j] = single
+        room.gridrow = row
+        room.gridrun = runs(row)
 
 def add_args(subparsers):
     parser = subparsers.add_parser('grid', add_help=False,
@@ -722,20 +758,29 @@ def add_args(subparsers):
     parserhelp.add_io(parser)
     parser.set_defaults(func=main)
 
+# output modes supported by this report
+modes = ('html', 'indesign', 'xml')
+
+@timing.timed('grid')
+def render(args, model, mode):
+    """ Write one output mode of the grids. """
+    with timing.stage('grid matrix'):
+        matrix()
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.sessions)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'grid')) as out:
+                write(out, model.sessions)
+        except config.NoOptionError:
+            pass
+
 def main(args):
-    fn = args.infile or config.get('input files', 'schedule')
-    (sessions, participants) = session.read(fn)
+    model = session.read_model(args.infile)
     if args.all or (args.html + args.indesign + args.xml == 0):
         args.html = args.indesign = args.xml = True
-    matrix()
-    for mode in ('html', 'indesign', 'xml'):
+    for mode in modes:
         if eval('args.' + mode):
-            outfunc = eval('%sOutput' % mode.capitalize())
-            if args.outfile:
-                write(outfunc(args.outfile), sessions)
-            else:
-                try:
-                    write(outfunc(config.get('output files ' + mode, 'grid')),
-                          sessions)
-                except config.NoOptionError:
-                    pass
+            render(args, model, mode)
@@ -24,8 +24,7 @@ import csv
 import re
 import time
 
-from . import config, featured, participant, session as SESSION
-from .room import Room
+from . import config, featured, participant, session as SESSION, tracks
 from .times import Day
 
 def check(args):
@@ -129,17 +128,7 @@ def main(args):
     start = time.strptime(config.get('convention', 'start'), '%Y-%m-%d')
     # time.struct_time(tm_year=2014, tm_mon=1, tm_mday=17, tm_hour=0,
     # tm_min=0, tm_sec=0, tm_wday=4, tm_yday=17, tm_isdst=-1)
-    tracks = []
-    try:
-        for area, expr in config.items('tracks classifier'):
-            expr = expr.replace('track', 'session.track')
-            expr = expr.replace('type', 'session.type')
-            expr = re.sub(r'room == (\'\w+\')',
-                          r'session.room == Room.rooms[\1]', expr)
-            area = area.replace(' - ', u'\u2014')
-            tracks.append((area, expr))
-    except config.NoSectionError:
-        pass
+    classifier = tracks.classifier()
     featured = []
     try:
         for (sessionid, unused) in config.items('featured sessions'):
@@ -157,11 +146,7 @@ def main(args):
         end = re.sub('([AP]M)', r' \1',
                      str(session.time + session.duration).upper())
 
-        track = session.track
-        for t, expr in tracks:
-            if eval(expr):
-                track = t
-                break
+        track = classifier(session, session.track)
         if session.sessionid in featured:
             track += '; Featured Events'
 
@@ -181,7 +166,7 @@ def main(args):
         for p in session.participants:
             writerow(linkswriter, ['', p.name, '', title, '', ''])
 
-    for p in sorted(participants.values()):
+    for p in sorted(participants.values(), key=participant.sortkey):
         try:
             bio = p.bio
         except AttributeError:
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" Incremental rebuilds for 'all --incremental'.
+
+After each 'all --incremental' run, a digest of every session and
+participant, as seen by each report, is saved in .conguide/build.pickle.
+The next incremental run computes the same digests from the new model,
+diffs them by sessionid (or participant name), and only re-renders the
+reports whose sessions or participants changed. A report only sees the session fields it uses, and
+the ones its configured templates print, so e.g. a description change
+doesn't re-render the grid or the track list unless they print it.
+
+Any change to the config file, the bios file, or the program itself
+re-renders everything, as does a missing output file. Html outputs are
+also re-rendered whenever the schedule file's date changes, because it's
+in their headers.
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+
+from . import cache, changes, config, output
+from .__init__ import __version__
+
+# session fields used by each report to lay it out, not counting its
+# templates; None means all of them
+depends = {
+    'schedule': None,
+    'featured': None,
+    'conguide': None,
+    'tracks': ('sessionid', 'index', 'time', 'duration', 'room', 'tracks',
+               'track', 'type', 'tags', 'title'),
+    'grid': ('sessionid', 'index', 'time', 'duration', 'room', 'track',
+             'type', 'title'),
+    'xref': ('sessionid',),
+    'bios': ('sessionid',),
+}
+
+# reports that list participants rather than sessions; only their
+# 'session' templates are filled from sessions
+by_participant = ('xref', 'bios')
+
+allfields = ('sessionid', 'index', 'time', 'duration', 'room', 'tracks',
+             'track', 'type', 'tags', 'title', 'description', 'participants',
+             'moderators')
+
+# session fields behind each template field (see Output.str<Field>)
+template_fields = {
+    'Index': ('index',),
+    'Day': ('time',),
+    'Time': ('time',),
+    'Duration': ('duration',),
+    'Title': ('title',),
+    'Track': ('track',),
+    'Type': ('type',),
+    'Level': ('room',),
+    'Room': ('room',),
+    'Usage': ('room',),
+    'Description': ('description',),
+    'Participants': ('participants', 'moderators'),
+    'Tags': ('tags',),
+}
+
+def template_names(template):
+    # the names of the Fields in a parsed template, and its optional parts
+    for token in template:
+        if isinstance(token, output.Template):
+            for name in template_names(token):
+                yield name
+        elif isinstance(token, output.Field):
+            yield token.name
+
+def fields(name):
+    """ Return the session fields report name uses, including the ones
+    printed by its templates in any mode.
+    """
+    if depends.get(name) is None:
+        return allfields
+    used = set(depends[name])
+    # parseTemplate doesn't need an open output
+    parser = output.Output.__new__(output.Output)
+    prefix = name + ' template'
+    for section in config.sections():
+        if section != prefix and not section.startswith(prefix + ' '):
+            continue
+        for (key, value) in config.items(section):
+            if name in by_participant and key != 'session':
+                continue
+            for field in template_names(parser.parseTemplate(value)):
+                if field in template_fields:
+                    used.update(template_fields[field])
+                elif hasattr(output.Output, 'str' + field):
+                    # a session field we don't know what goes into
+                    return allfields
+    return tuple([f for f in allfields if f in used])
+
+def value(session, field):
+    # a field as plain data, so the digest doesn't depend on object identity
+    v = getattr(session, field)
+    if field == 'time':
+        return (str(v.day), str(v))
+    if field in ('duration', 'room'):
+        return str(v)
+    if field in ('participants', 'moderators'):
+        return [p.name for p in v]
+    return v
+
+def digest(data):
+    return hashlib.md5(repr(data).encode('utf-8')).hexdigest()
+
+def digests(model, names):
+    """ Return {report name: {sessionid or participant name: digest}}. """
+    # every field of every session, converted once
+    rows = [(s, [value(s, f) for f in allfields]) for s in model.sessions]
+    byfield = dict([(f, i) for (i, f) in enumerate(allfields)])
+    results = {}
+    for name in names:
+        if name in by_participant:
+            continue
+        used = fields(name)
+        if used is allfields:
+            results[name] = dict([(s.sessionid, digest(row)) for (s, row) in rows])
+        else:
+            ii = [byfield[f] for f in used]
+            results[name] = dict([(s.sessionid, digest([row[i] for i in ii]))
+                                  for (s, row) in rows])
+
+    for name in by_participant:
+        if name not in names:
+            continue
+        ii = [byfield[f] for f in fields(name)]
+        short = dict([(id(s), [row[i] for i in ii]) for (s, row) in rows])
+        pdigests = {}
+        for p in model.participants.values():
+            pdigests[p.name] = digest((p.sortkey, getattr(p, 'firstname', None),
+                                       getattr(p, 'lastname', None),
+                                       getattr(p, 'bio', None),
+                                       [short.get(id(s)) for s in p.sessions]))
+        results[name] = pdigests
+    return results
+
+def build_key(args, model):
+    """ Everything other than the model that goes into the outputs. """
+    h = hashlib.sha1()
+    h.update(repr((__version__, args.infile, args.outfile)).encode('utf-8'))
+    cache._digest(config.cfgfile, h)
+    if model.bios and os.path.exists(model.bios):
+        cache._digest(model.bios, h)
+    for fn in sorted(glob.glob(os.path.join(os.path.dirname(__file__), '*.py'))):
+        cache._digest(fn, h)
+    return h.hexdigest()
+
+def outfile(args, name, mode):
+    # the file a report writes, if it writes one
+    if args.outfile and name != 'conguide':
+        return args.outfile
+    try:
+        return config.get('output files ' + mode, name)
+    except (config.NoSectionError, config.NoOptionError):
+        return None
+
+def stamp(new, name, mode):
+    # html headers include the input file's date, so html outputs are
+    # out of date whenever it changes
+    if mode == 'html':
+        return digest((new['summary'][name], config.source_date))
+    return new['summary'][name]
+
+def path():
+    return os.path.join(cache.DIR, 'build.pickle')
+
+def load():
+    try:
+        with open(path(), 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return {}
+
+def outdated(args, model, jobs):
+    """ Return the jobs whose outputs are out of date, and the new manifest. """
+    names = sorted(set([name for (name, mode) in jobs]))
+    new = {'key': build_key(args, model), 'digests': digests(model, names)}
+    # one digest per report, to compare with the last build of each output
+    new['summary'] = dict([(name, digest(sorted(new['digests'][name].items())))
+                           for name in names])
+
+    old = load()
+    if old.get('key') != new['key']:
+        if not config.quiet:
+            print('incremental: %s, rendering everything' % \
+                  ('config or program changed' if old else 'no previous build'))
+        return (jobs, new)
+
+    todo = []
+    for (name, mode) in jobs:
+        fn = outfile(args, name, mode)
+        if old['outputs'].get((name, mode)) != stamp(new, name, mode) or \
+           (fn and not os.path.exists(fn)):
+            todo.append((name, mode))
+    if config.debug:
+        for name in names:
+            (added, removed, changed) = changes.compare(old['digests'].get(name, {}),
+                                                        new['digests'][name])
+            print('%s: %d added, %d removed, %d changed' % \
+                  (name, len(added), len(removed), len(changed)))
+    if not config.quiet:
+        print('incremental: rendering %d of %d outputs' % (len(todo), len(jobs)))
+    return (todo, new)
+
+def save(jobs, new):
+    """ Record the outputs just rendered (or found up to date). """
+    if not config.cache:
+        return
+    old = load()
+    if old.get('key') == new['key']:
+        # keep the state of outputs that weren't asked for this time
+        outputs = old['outputs']
+        digests = old['digests']
+        digests.update(new['digests'])
+    else:
+        (outputs, digests) = ({}, new['digests'])
+    for (name, mode) in jobs:
+        outputs[(name, mode)] = stamp(new, name, mode)
+    try:
+        if not os.path.isdir(cache.DIR):
+            os.mkdir(cache.DIR)
+        with open(path(), 'wb') as f:
+            pickle.dump({'key': new['key'], 'digests': digests,
+                         'outputs': outputs}, f, pickle.HIGHEST_PROTOCOL)
+    except (IOError, OSError) as e:
+        if config.debug:
+            print('info: could not save %s: %s' % (path(), e))
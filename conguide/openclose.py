@@ -13,7 +13,7 @@
 import argparse
 import re
 
-from . import config, session
+from . import classifier, config, session
 from .times import Day, Duration
 
 parser = argparse.ArgumentParser()
@@ -34,15 +34,15 @@ session.read(args.infile or config.get('input files', 'schedule'))
 exprs = []
 try:
     expr = config.get('grid no print', 'title starts with')
-    exprs.append('session.title.startswith((%s))' % expr)
+    exprs.append('title.startswith((%s))' % expr)
 except (config.NoSectionError, config.NoOptionError):
     pass
 try:
     expr = config.get('grid no print', 'title ends with')
-    exprs.append('session.title.endswith((%s))' % expr)
+    exprs.append('title.endswith((%s))' % expr)
 except (config.NoSectionError, config.NoOptionError):
     pass
-noprint = ' or '.join(exprs)
+noprint = classifier.compile(' or '.join(exprs)) if exprs else None
 
 for day in Day.days:
     print(day)
@@ -51,7 +51,7 @@ for day in Day.days:
         for session in time.sessions:
             # [grid no print]
             # title ends with = 'Open', 'Opens', 'Close', 'Closes', 'Lunch', 'Dinner'
-            if noprint and eval(noprint):
+            if noprint and noprint(session):
                 if args.raw:
                     print('%s %s (%s)' % (session.title, session.time, session.duration))
                 else:
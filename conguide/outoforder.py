@@ -26,7 +26,7 @@ from . import config, session, participant
 
 ps = []
 (sessions, participants) = session.read(config.get('input files', 'schedule'))
-for p in sorted(participants.values()):
+for p in sorted(participants.values(), key=participant.sortkey):
     ps.append(p.name)
 
 def read(fn):
@@ -18,16 +18,177 @@
 
 """Base class for output classes."""
 
-import codecs
 import copy
+import itertools
+import os
 import re
 import time
 import types
 
+try:
+    from functools import lru_cache
+except ImportError:
+    # py2: no cache
+    def lru_cache(maxsize):
+        return lambda func: func
+
 from . import config
 
+# Dashes and quotes, in one pass:
+# - the much-misunderstood n-dash (1-2)
+# - m--dash, m -- dash, m - dash
+#   (leaving spaces before a '--' to the m--dash, as if it went first)
+# - single and double quotes, sorted out in smartquote()
+_typography = re.compile(r'(\d) *- *(\d)|( *-{2,} *| +- +(?! *--))|([\'"])')
+_word = re.compile(r'\w')
+
+def smartquote(m):
+    """ re.sub callback for _typography. """
+    if m.group(1):
+        return m.group(1) + u'\u2013' + m.group(2)
+    if m.group(3):
+        return u'\u2014'
+    single = (m.group(4) == "'")
+    (left, right) = (u'\u2018', u'\u2019') if single else (u'\u201c', u'\u201d')
+    text = m.string
+    i = m.start()
+    after = text[i+1:i+2]
+    if single and after and after in '0123456789':
+        # right quote before abbreviated years and decades ('70s)
+        return right
+    if i == 0:
+        # beginning quote -> left
+        return left
+    if i + 1 == len(text) or (i + 2 == len(text) and after == '\n'):
+        # ending quote -> right
+        return right
+    if not _word.match(text[i-1]) and text[i-1] not in ',.!?' and \
+       after and _word.match(after):
+        # left quote
+        return left
+    # all remaining quotes -> right
+    return right
+
+@lru_cache(maxsize=8192)
+def smarten(text):
+    """ Convert dashes and quotes to their typographic forms. """
+    return _typography.sub(smartquote, text)
+
+# os.rename() won't replace an existing file on Windows
+_replace = getattr(os, 'replace', os.rename)
+
+# while staging, the (temp file, output file, bytes) of each finished Sink
+staged = None
+
+# to tell apart the temp files of Sinks with the same output file
+_serial = itertools.count()
+
+def stage():
+    """ Start staging: finished Sinks leave their temp files for commit()
+    instead of renaming them into place.
+    """
+    global staged
+    staged = []
+
+def unstage():
+    """ Stop staging, and return what was staged. """
+    global staged
+    (files, staged) = (staged or [], None)
+    return files
+
+def commit(files):
+    """ Move staged files into place, in the order they were written. """
+    for (tmp, fn, size) in files:
+        _replace(tmp, fn)
+
+def discard(files):
+    """ Remove staged files, leaving the outputs as they were. """
+    for (tmp, fn, size) in files:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+class Sink(object):
+    """ A file-like object for writing an output file.
+
+    Text written to it is collected, and encoded and written out a few
+    thousand fragments at a time. The file is written under a temporary
+    name and renamed into place when it's closed, so there's never a
+    half-written output file, even if a run crashes. As a context manager,
+    it only writes the file if the block doesn't raise an exception.
+
+    While staging (see stage()), closing it leaves the temporary file for
+    commit() or discard().
+    """
+
+    # fragments to collect between writes
+    chunk = 4096
+
+    def __init__(self, fn, codec='utf-8', errors='strict'):
+        self.fn = fn
+        self.codec = codec
+        self.errors = errors
+        self.parts = []
+        (head, tail) = os.path.split(fn)
+        self.tmp = os.path.join(head, '.%s.%d.%d.tmp' % \
+                                (tail, os.getpid(), next(_serial)))
+        self.f = None
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        if len(self.parts) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        data = u''.join(self.parts).encode(self.codec, self.errors)
+        self.parts = []
+        if not self.f:
+            self.f = open(self.tmp, 'wb')
+        self.f.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """ Write the file. """
+        if self.parts is None:
+            return
+        try:
+            self.flush()
+            self.f.close()
+            if staged is None:
+                _replace(self.tmp, self.fn)
+            else:
+                staged.append((self.tmp, self.fn, self.size))
+        except BaseException:
+            self.abort()
+            raise
+        self.parts = None
+
+    def abort(self):
+        """ Forget everything, and leave the file as it was. """
+        self.parts = None
+        if self.f:
+            self.f.close()
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
 class Output(object):
-    """ Parent class for TextOutput etc. in schedule.py etc. """
+    """ Parent class for TextOutput etc. in schedule.py etc.
+
+    Use it as a context manager, so the file is finished and written at
+    the end of the with statement, or not at all if there's an exception:
+
+        with TextOutput(fn) as output:
+            write(output, sessions)
+    """
 
     def __init__(self, fn, fd=None, codec='utf-8'):
         Output._readconfig(self)
@@ -35,9 +196,9 @@ class Output(object):
             self.f = fd
             self.leaveopen = True
         else:
-            #self.f = open(fn, 'w')
-            self.f = codecs.open(fn, 'w', codec)
+            self.f = Sink(fn, codec)
             self.leaveopen = False
+        self.closed = False
 
     def _readconfig(self):
         Output._readconfig = lambda x: None
@@ -50,41 +211,30 @@ class Output(object):
         except config.NoOptionError:
             pass
 
-    def __del__(self):
+    def close(self):
+        """ Finish the output; subclasses write their trailers first. """
+        self.closed = True
         if not self.leaveopen:
             self.f.close()
 
-    def cleanup(self, text):
-        if text:
-            # convert dashes
-            # the much-misunderstood n-dash
-            text = re.sub(r'(\d) *- *(\d)', r'\1'+u'\u2013'+r'\2', text)
-            # m--dash, m -- dash, etc.
-            text = re.sub(r' *-{2,} *', u'\u2014', text)
-            # m - dash
-            text = re.sub(r' +- +', u'\u2014', text)
-
-            # convert quotes
-            # right quote before abbreviated years and decades ('70s)
-            text = re.sub(r'\'([0-9])', u'\u2019'+r'\1', text)
-            # beginning single quote -> left
-            text = re.sub(r'^\'', u'\u2018', text)
-            # ending single quote -> right
-            text = re.sub(r'\'$', u'\u2019', text)
-            # left single quote
-            text = re.sub(r'([^\w,.!?])\'(\w)', r'\1'+u'\u2018'+r'\2', text)
-            # all remaining single quotes -> right
-            text = re.sub(r'\'', u'\u2019', text)
-            # beginning double quote -> left
-            text = re.sub(r'^"', u'\u201c', text)
-            # ending double quote -> right
-            text = re.sub(r'"$', u'\u201d', text)
-            # left double quote
-            text = re.sub(r'([^\w,.!?])"(\w)', r'\1'+u'\u201c'+r'\2', text)
-            # all remaining double quotes -> right
-            text = re.sub(r'"', u'\u201d', text)
+    def __enter__(self):
+        return self
 
-        return text
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.closed = True
+            if not self.leaveopen:
+                self.f.abort()
+
+    def __del__(self):
+        # for outputs that weren't used in a with statement
+        if not getattr(self, 'closed', True):
+            self.close()
+
+    def cleanup(self, text):
+        return smarten(text) if text else text
 
     def parenthesize(self, text):
         return '(%s)' % text if text else ''
@@ -117,29 +267,22 @@ class Output(object):
         return self.compileTemplate(tokens)
 
     def compileTemplate(self, template):
-        newTemplate = []
+        newTemplate = Template()
         for token in template:
             if isinstance(token, list):
                 token = self.compileTemplate(token)
             else:
-                tokname = token
-                m = re.match(r'\((.*)\)', token)
-                if m:
-                    parens = True
-                    token = m.group(1)
-                else:
-                    parens = False
-                if re.match(r'\w+', token):
-                    if token.isupper():
-                        codestring = 'self.str%s(session, True)' % token.capitalize()
-                    else:
-                        codestring = 'self.str%s(session)' % token.capitalize()
-                    if parens:
-                        codestring = 'self.parenthesize(%s)' % codestring
-                    codestring = 'self.markup%s(session, %s)' % (token.capitalize(), codestring)
-                    token = (compile(codestring, '<string>', 'eval'), tokname)
-            newTemplate.append(token)
-        return newTemplate                    
+                m = re.match(r'\((.*)\)$', token)
+                name = m.group(1) if m else token
+                if re.match(r'\w+$', name):
+                    token = Field(name, token, parens=bool(m))
+            if newTemplate and not isinstance(token, (list, Field)) and \
+               not isinstance(newTemplate[-1], (list, Field)):
+                # merge runs of literal text
+                newTemplate[-1] += token
+            else:
+                newTemplate.append(token)
+        return newTemplate
 
     # Fill a template (list of fields, with optional elements as sub-lists).
     # At each level, count the number of lexemes that expand into non-empty
@@ -149,31 +292,11 @@ class Output(object):
     # XXX This treats the top-level list as an optional list, so if nothing
     # expands, it blows away any static text as well.
     def fillTemplate(self, template, session):
-        fields = []
-        ok = False
-        for token in template:
-            if isinstance(token, list):
-                # sub-list of optional elements
-                value = self.fillTemplate(token, session)
-                if value:
-                    fields.append(value)
-                    ok = True
-            elif isinstance(token, tuple):
-                # e.g. markupIndex(session, strIndex(session))
-                # text is the literal token in the config template.
-                # html markup causes us to try e.g. strDd()
-                # XXX change '<text>' to process as literal above
-                (code, text) = token
-                try:
-                    value = eval(code)
-                    if value:
-                        fields.append(value)
-                        ok = True
-                except AttributeError:
-                    fields.append(text)
-            else:
-                fields.append(token)
-        return ''.join(fields) if ok else ''
+        try:
+            fill = template.bound[self.__class__]
+        except KeyError:
+            fill = template.bind(self.__class__)
+        return fill(self, session)
 
     def strIndex(self, session, upper=False):
         return str(session.index)
@@ -266,7 +389,7 @@ class Output(object):
                     name = self.markupParticipant(p, name)
                 except AttributeError:
                     pass
-                if p in session.moderators:
+                if p in session.moderatorset:
                     name += u'\u00A0(m)'
                 pp.append(name)
             return ', '.join(pp)
@@ -292,3 +415,91 @@ class Output(object):
     def markupTags(self, session, text):
         return text
 
+
+class Field(object):
+    """ A template field, e.g. 'title' expands to
+    markupTitle(session, strTitle(session)).
+
+    Upper-case names pass upper=True to the str function, and parenthesized
+    names, e.g. '(room)', get parenthesized before markup.
+    """
+
+    def __init__(self, name, text, parens=False):
+        self.name = name.capitalize()
+        self.text = text
+        self.upper = name.isupper()
+        self.parens = parens
+
+    def bind(self, cls):
+        """ Return a function(output, session) for this field in output class
+        cls, or None if the class doesn't support it.
+        """
+        strfunc = getattr(cls, 'str' + self.name, None)
+        markup = getattr(cls, 'markup' + self.name, None)
+        if not (strfunc and markup):
+            return None
+        args = (True,) if self.upper else ()
+        if self.parens:
+            parenthesize = cls.parenthesize
+            def field(output, session):
+                return markup(output, session,
+                              parenthesize(output, strfunc(output, session, *args)))
+        else:
+            def field(output, session):
+                return markup(output, session, strfunc(output, session, *args))
+        return field
+
+class Template(list):
+    """ A parsed template: a list of literal strings, Fields, and optional
+    sub-Templates.
+
+    Templates are shared between output classes, so fields get resolved
+    against an output class the first time that class fills the template.
+    Fields the class doesn't support (e.g. '<dd>' in an html template)
+    become literal text at that point.
+    """
+
+    # op kinds
+    LITERAL, FIELD, OPTIONAL = range(3)
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.bound = {}
+
+    def bind(self, cls):
+        """ Compile the template for output class cls, return a
+        function(output, session).
+        """
+        ops = []
+        for token in self:
+            if isinstance(token, Template):
+                op = (Template.OPTIONAL, token.bound.get(cls) or token.bind(cls), None)
+            elif isinstance(token, Field):
+                field = token.bind(cls)
+                if field:
+                    op = (Template.FIELD, field, token.text)
+                else:
+                    op = (Template.LITERAL, token.text, None)
+            else:
+                op = (Template.LITERAL, token, None)
+            if op[0] == Template.LITERAL and ops and ops[-1][0] == Template.LITERAL:
+                ops[-1] = (Template.LITERAL, ops[-1][1] + op[1], None)
+            else:
+                ops.append(op)
+
+        LITERAL = Template.LITERAL
+        def fill(output, session):
+            fields = []
+            ok = False
+            for (kind, op, text) in ops:
+                if kind == LITERAL:
+                    fields.append(op)
+                    continue
+                value = op(output, session)
+                if value:
+                    fields.append(value)
+                    ok = True
+            return ''.join(fields) if ok else ''
+
+        self.bound[cls] = fill
+        return fill
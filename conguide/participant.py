@@ -16,11 +16,41 @@
 # TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
 # PERFORMANCE OF THIS SOFTWARE.
 
+from operator import attrgetter
 import re
 
 from . import config
 
+# Surnames that take two tokens: a particle before the last token (da, de,
+# del, van, von...), or a suffix as the last token (Jr., III, PhD...).
+_particle = re.compile(r'd[aeiou]l?$|v[ao]n$', re.IGNORECASE)
+_suffix = re.compile(r'[JS]r\.?$|I+$|[^A-Za-z]+$|PhD$|DVM$')
+_punct = re.compile(r'\W')
+
+def makesortkey(name):
+    """ Return the computed sortkey for a name: Lastname Firstname Middle. """
+    nn = name.split(' ')
+    # the last token is usually the last name
+    first = nn[:-1]
+    last = nn[-1]
+    # some common exceptions to the rule
+    if first and (_particle.match(first[-1]) or _suffix.match(last)):
+        # last two tokens are the last name
+        first = nn[:-2]
+        last = ' '.join(nn[-2:])
+    # remove punctuation for sorting purposes
+    last = _punct.sub(' ', last)
+    # mash it together and  make it case-insensitive
+    return ' '.join([last] + first).lower()
+
 class Participant(object):
+    # firstname, lastname, bio and badgeid are only set by importers that
+    # read bios
+    __slots__ = ('name', 'sessions', 'sortkey',
+                 'firstname', 'lastname', 'bio', 'badgeid')
+
+    # computed sortkeys by name, kept in the snapshot cache
+    sortkeys = {}
 
     def __init__(self, name):
         self._readconfig()
@@ -31,26 +61,10 @@ class Participant(object):
             # configured sortkey (usually unhyphenated last name)
             self.sortkey = Participant.sortname[name].lower()
         except KeyError:
-            # sortkey = Lastname Firstname Middle
-            nn = name.split(' ')
-            # the last token is usually the last name
-            first = nn[:-1]
-            last = nn[-1]
-            # some common exceptions to the rule
-            if first and \
-               (re.match(r'd[aeiou]l?$', first[-1], re.IGNORECASE) or \
-                re.match(r'v[ao]n$', first[-1], re.IGNORECASE) or \
-                re.match(r'[JS]r\.?$', last) or \
-                re.match(r'I+$', last) or \
-                re.match(r'[^A-Za-z]+$', last) or \
-                last == 'PhD' or last == 'DVM'):
-                # last two tokens are the last name
-                first = nn[:-2]
-                last = ' '.join(nn[-2:])
-            # remove punctuation for sorting purposes
-            last = re.sub(r'\W', ' ', last, re.UNICODE)
-            # mash it together and  make it case-insensitive
-            self.sortkey = ' '.join([last] + first).lower()
+            try:
+                self.sortkey = Participant.sortkeys[name]
+            except KeyError:
+                self.sortkey = Participant.sortkeys[name] = makesortkey(name)
 
     def _readconfig(self):
         Participant._readconfig = lambda x: None
@@ -76,6 +90,8 @@ class Participant(object):
     def __str__(self):
         return self.name
 
+# for sorted(participants, key=sortkey), which is much faster than using __lt__
+sortkey = attrgetter('sortkey')
 
 def read(fn, participants):
     import importlib
@@ -20,21 +20,14 @@ import re
 
 from . import config
 
-class Level(object):
-    index = 0
-
-    def __init__(self, name):
-        self._readconfig()
-        self.index = Level.index
-        Level.index += 1
-        self.name = name
-        self.pubsname = name
-        self.rooms = []
-
-        Level.levels[name] = self
+# Level and Room both derive from this, so we can read the configuration
+# from either class. (Room can't just inherit from Level: Level's 'rooms'
+# slot would hide the Room.rooms registry.)
+class Place(object):
+    __slots__ = ()
 
     def _readconfig(self):
-        Level._readconfig = lambda x: None
+        Place._readconfig = lambda x: None
         Level.levels = {}
         Room.rooms = {}
         for section in config.sections():
@@ -75,21 +68,42 @@ class Level(object):
                 except config.NoOptionError:
                     pass
 
+class Level(Place):
+    __slots__ = ('index', 'name', 'pubsname', 'rooms')
+
+    # number of levels so far
+    count = 0
+
+    def __init__(self, name):
+        self._readconfig()
+        self.index = Level.count
+        Level.count += 1
+        self.name = name
+        self.pubsname = name
+        self.rooms = []
+
+        Level.levels[name] = self
+
     def __lt__(self, other):
         return (other and (self.index < other.index))
 
     def __str__(self):
         return self.pubsname
 
-# This inherits from Level purely to get access to _readconfig(),
-# so we can read the configuration from either class.
-class Room(Level):
-    index = 0
+class Room(Place):
+    # gridrooms is only set for [room ...] sections with 'grid room';
+    # the rest are set by the grid report
+    __slots__ = ('index', 'level', 'name', 'pubsname', 'usage', 'sessions',
+                 'gridrooms', 'gridsessions', 'gridrow', 'gridrun', 'major',
+                 'last')
+
+    # number of rooms so far
+    count = 0
 
     def __init__(self, name, level=None):
         self._readconfig()
-        self.index = Room.index
-        Room.index += 1
+        self.index = Room.count
+        Room.count += 1
         self.level = level
         self.name = name
         self.pubsname = name
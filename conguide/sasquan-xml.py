@@ -53,14 +53,41 @@ The XML schema is like this::
 import re
 import xml.etree.ElementTree
 
-from . import config
-from .participant import Participant
-from .session import Session
+from . import config, participant, session, timing
 
 sessions = []
 participants = {}
 
-def read(fn):
+def timeslots(fn):
+    """ Yield the <time> elements of an XML file, one at a time, as they're
+    parsed. Each one is cleared (and dropped from the tree) once the caller
+    is done with it, so the whole document is never in memory.
+    """
+    parser = xml.etree.ElementTree.XMLParser(encoding='utf-8')
+    depth = 0
+    root = None
+    for event, elem in xml.etree.ElementTree.iterparse(fn, ('start', 'end'), parser):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+        else:
+            depth -= 1
+            # <time> also appears inside <start>, so only look at the
+            # children of <program>
+            if depth == 1:
+                yield elem
+                root.clear()
+
+def timeslots_tree(fn):
+    """ Yield the <time> elements of an XML file, from the parsed document.
+    (The old way, kept for comparison; see bench.py.)
+    """
+    parser = xml.etree.ElementTree.XMLParser(encoding='utf-8')
+    for timeslot in xml.etree.ElementTree.parse(fn, parser).getroot():
+        yield timeslot
+
+def read(fn, timeslots=timeslots):
     """ Read an XML file, return a list of sessions and a dict of participants. """
 
     global sessions, participants
@@ -68,83 +95,86 @@ def read(fn):
     if sessions:
         return (sessions, participants)
 
-    #for timeslot in xml.etree.ElementTree.parse(fn).getroot():
-    parser = xml.etree.ElementTree.XMLParser(encoding='utf-8')
-    for timeslot in xml.etree.ElementTree.parse(fn, parser).getroot():
-        assert timeslot.tag == 'time'
-        start = timeslot[0]
-        assert(start.tag == 'start')
-        day = start.findtext('day')
-        time = start.findtext('time')
-
-        for item in timeslot[1:]:
-            assert item.tag == 'item'
-            room = item.findtext('room')
-            venue = item.findtext('venue')
-            row = {'day':day, 'time':time, 'room':room, 'level':venue,
-                   'tracks':[], 'tags':[],
-                   'participants':[], 'moderators':[]}
-            for a in item:
-                if a.tag == 'details':
-                    for b in a:
-                        if b.tag == 'tracks':
-                            for c in b:
-                                row['tracks'].append(c.text)
-                        elif b.tag == 'tags':
-                            for c in b:
-                                row['tags'].append(c.text)
-                        elif b.tag == 'people':
-                            for c in b:
-                                name = c.findtext('name')
-                                if name in participant.Participant.chname:
-                                    name = participant.Participant.chname[name]
-                                row['participants'].append(name)
-                                if c.tag == 'moderator':
-                                    row['moderators'].append(name)
-                        else:
-                            row[b.tag] = b.text
-                else:
-                    row[a.tag] = a.text
-
-            row['sessionid'] = row['reference_number']
-            row['index'] = row['reference_number']
-            try:
-                row['type'] = row['format']
-            except KeyError:
-                row['type'] = ''
-
-            # error checking
-            if not row['reference_number']:
-                if not config.quiet:
-                    print('warning: %s %s %s: empty reference_number element' %
-                          (row['day'], row['time'], row['title']))
-            tags = []
-            for t in row['tags']:
-                if t in tags:
-                    if not config.quiet:
-                        print('warning: %s %s: duplicate tag %s' % \
-                              (row['reference_number'], row['title'], t))
-                else:
-                    tags.append(t)
-            row['tags'] = tags
-
-            # cleanup
-            for k in row.keys():
-                minimal = (k not in ['title', 'description'])
-                row[k] = cleanup(row[k], minimal)
-
-            # make a new session from this data
-            s = session.Session(row, participants)
-            # if session is in [session do not print], the instance doesn't get
-            # initialized, and we can drop it (should we explicitly delete it?)
-            if hasattr(s, 'sessionid'):
-                sessions.append(s)
+    with timing.stage('sessions'):
+        for timeslot in timeslots(fn):
+            assert timeslot.tag == 'time'
+            start = timeslot[0]
+            assert(start.tag == 'start')
+            day = start.findtext('day')
+            time = start.findtext('time')
+
+            for item in timeslot[1:]:
+                assert item.tag == 'item'
+                s = session.Session(item_row(day, time, item), participants)
+                # if session is in [session do not print], the instance doesn't get
+                # initialized, and we can drop it (should we explicitly delete it?)
+                if hasattr(s, 'sessionid'):
+                    sessions.append(s)
 
     # sort
-    sessions = sorted(sessions)
+    with timing.stage('sort'):
+        sessions = sorted(sessions, key=session.sortkey)
 
     return (sessions, participants)
 
+def item_row(day, time, item):
+    """ Make a session row (a dict) from an <item> element. """
+    room = item.findtext('room')
+    venue = item.findtext('venue')
+    row = {'day':day, 'time':time, 'room':room, 'level':venue,
+           'tracks':[], 'tags':[],
+           'participants':[], 'moderators':[]}
+    for a in item:
+        if a.tag == 'details':
+            for b in a:
+                if b.tag == 'tracks':
+                    for c in b:
+                        row['tracks'].append(c.text)
+                elif b.tag == 'tags':
+                    for c in b:
+                        row['tags'].append(c.text)
+                elif b.tag == 'people':
+                    for c in b:
+                        name = c.findtext('name')
+                        if name in participant.Participant.chname:
+                            name = participant.Participant.chname[name]
+                        row['participants'].append(name)
+                        if c.tag == 'moderator':
+                            row['moderators'].append(name)
+                else:
+                    row[b.tag] = b.text
+        else:
+            row[a.tag] = a.text
+
+    row['sessionid'] = row['reference_number']
+    row['index'] = row['reference_number']
+    try:
+        row['type'] = row['format']
+    except KeyError:
+        row['type'] = ''
+
+    # error checking
+    if not row['reference_number']:
+        if not config.quiet:
+            print('warning: %s %s %s: empty reference_number element' %
+                  (row['day'], row['time'], row['title']))
+    tags = []
+    for t in row['tags']:
+        if t in tags:
+            if not config.quiet:
+                print('warning: %s %s: duplicate tag %s' % \
+                      (row['reference_number'], row['title'], t))
+        else:
+            tags.append(t)
+    row['tags'] = tags
+
+    # cleanup
+    for k in row.keys():
+        minimal = (k not in ['title', 'description'])
+        row[k] = cleanup(row[k], minimal)
+
+    return row
+
 def cleanup(field, minimal=False):
     if type(field) is list:
         for i, f in enumerate(field):
@@ -16,11 +16,13 @@
 # TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
 # PERFORMANCE OF THIS SOFTWARE.
 
+import codecs
 import copy
 import re
+import sys
+import tempfile
 
-from . import parserhelp, config, output, session
-from .room import Room
+from . import parserhelp, classifier, config, output, session, timing
 from .times import Day, Duration
 
 prune = False
@@ -46,20 +48,6 @@ class Output(output.Output):
         except config.NoSectionError:
             pass
 
-        Output.icons = []
-        try:
-            for char, expr in config.items('schedule icons'):
-                #config.icons.append((char, expr))
-                expr = expr.replace('track', 'session.track')
-                expr = expr.replace('type', 'session.type')
-                expr = expr.replace('sessionid', 'session.sessionid')
-                expr = expr.replace(' in ', ' in Output.')
-                expr = re.sub(r'room == (\'\w+\')',
-                              r'session.room == Room.rooms[\1]', expr)
-                Output.icons.append((char, expr))
-        except config.NoSectionError:
-            pass
-
         Output.presentation = []
         try:
             for sessionid, unused in config.items('schedule presentation'):
@@ -80,11 +68,11 @@ class Output(output.Output):
             for k, expr in config.items('schedule prune participants'):
                 if k == 'type':
                     for n in re.split(r',\s*', expr):
-                        nn.append('session.type == \'%s\'' % n)
+                        nn.append('type == \'%s\'' % n)
                 elif k == 'title':
                     for n in re.split(r',\s*', expr):
-                        nn.append('session.title.startswith(\'%s\')' % n)
-            Output.prune = ' or '.join(nn)
+                        nn.append('title.startswith(\'%s\')' % n)
+            Output.prune = classifier.compile(' or '.join(nn)) if nn else None
         except config.NoSectionError:
             pass
 
@@ -112,6 +100,10 @@ class Output(output.Output):
         except config.NoSectionError:
             pass
 
+        # these can refer to [schedule combat] etc. above, e.g.
+        # s = (sessionid in combat or type == 'Demonstration')
+        Output.icons = classifier.read('schedule icons', vars(Output))
+
 class TextOutput(Output):
 
     name = 'text'
@@ -177,9 +169,9 @@ class HtmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         text = Output.cleanup(self, text)
@@ -202,6 +194,19 @@ class HtmlOutput(Output):
                 href = None
         return '<a href="%s#%s">%s</a>' % (href, re.sub(r'\W', '', name), name) if href else name
 
+class HtmlBody(HtmlOutput):
+    """ The sessions of an html schedule, without the header and trailer,
+    written to fd, for streaming. The header links to every day, so it
+    can't be written until all the sessions have been read.
+    """
+
+    def __init__(self, fd):
+        Output.__init__(self, None, fd)
+        self._readconfig()
+
+    def close(self):
+        Output.close(self)
+
 class XmlOutput(Output):
 
     name = 'xml'
@@ -222,10 +227,9 @@ class XmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</schedule>\n')
-        if not self.leaveopen:
-            Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -270,15 +274,7 @@ class XmlOutput(Output):
         return '<ss-room>%s</ss-room>' % text if text else ''
 
     def strIcon(self, session):
-        if self.icons:
-            icon = None
-            for k, v in self.icons:
-                if eval(v):
-                    icon = k
-                    break
-            if icon:
-                return icon
-        return ''
+        return self.icons(session, '')
 
     def markupIcon(self, session, text):
         return '<ss-icon>%s</ss-icon>' % text if text else ''
@@ -298,7 +294,7 @@ class XmlOutput(Output):
         if session.sessionid in self.nopartic:
             return ''
         # Prune participants to save space.
-        if prune and self.prune and eval(self.prune):
+        if prune and self.prune and self.prune(session):
             if config.debug:
                 pp = []
                 for p in session.participants:
@@ -315,6 +311,13 @@ class XmlOutput(Output):
         return '<ss-tags>%s</ss-tags>' % ('#' + ', #'.join(session.tags)) if session.tags else ''
 
 def write(output, sessions):
+    writeOne = writer(output)
+    for s in sessions:
+        writeOne(s)
+
+def writer(output):
+    # Return a function that writes a session to output, after a day or
+    # time separator if it starts a new one. Sessions come in order.
 
     def writeDay(session):
         try:
@@ -338,16 +341,17 @@ def write(output, sessions):
         text = output.markupSession(session, text)
         output.f.write(text + '\n')
 
-    curday = curtime = None
-    for s in sessions:
-        if s.time.day != curday:
+    # current day and time
+    cur = [None, None]
+    def writeOne(s):
+        if s.time.day != cur[0]:
             writeDay(s)
-            curday = s.time.day
-            curtime = s.time
-        elif s.time != curtime:
+            cur[:] = [s.time.day, s.time]
+        elif s.time != cur[1]:
             writeTime(s)
-            curtime = s.time
+            cur[1] = s.time
         writeSession(s)
+    return writeOne
 
 def add_args(subparsers):
     parser = subparsers.add_parser('schedule', add_help=False,
@@ -358,10 +362,13 @@ def add_args(subparsers):
                         help='don\'t prune participants to save space (xml only)')
     parser.add_argument('--deduplicate', dest='dedup', action='store_true',
                         help='Replace duplicate descriptions with "See #nnn for description." (xml only)')
+    parser.add_argument('--stream', action='store_true',
+                        help='write output while reading the input (not with --deduplicate)')
     parser.set_defaults(func=main)
 
-def main(args):
-    global prune, dedup, ses2idx
+def configure(args, model):
+    """ Set the xml-only options, from the command line or the config. """
+    global prune, dedup
     try:
         prune = args.prune
     except AttributeError:
@@ -375,21 +382,81 @@ def main(args):
         except:
             pass
 
+    if dedup and model:
+        for s in model.sessions:
+            ses2idx[s.sessionid] = s.index
+
+# output modes supported by this report
+modes = ('text', 'html', 'xml')
+
+@timing.timed('schedule')
+def render(args, model, mode):
+    """ Write one output mode of the schedule. """
+    configure(args, model)
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.sessions)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'schedule')) as out:
+                write(out, model.sessions)
+        except config.NoOptionError:
+            pass
+
+def stream(args):
+    # Write the outputs as the input file is read, all from one pass.
+    # Html sessions go to a temp file, and are copied in after the header
+    # (which links to every day) once all the days are known.
+    configure(args, None)
+    if dedup:
+        if not config.quiet:
+            print('warning: can\'t stream deduplicated output, reading the whole schedule')
+        return False
     fn = args.infile or config.get('input files', 'schedule')
-    (sessions, participants) = session.read(fn)
+    outs = []
+    tmp = html = None
+    try:
+        for mode in modes:
+            if eval('args.' + mode):
+                try:
+                    outfn = args.outfile or config.get('output files ' + mode, 'schedule')
+                except config.NoOptionError:
+                    continue
+                if mode == 'html':
+                    (tmp, html) = (tempfile.TemporaryFile(), outfn)
+                    outs.append(HtmlBody(codecs.getwriter('utf-8')(tmp)))
+                else:
+                    outs.append(eval('%sOutput' % mode.capitalize())(outfn))
+        writers = [writer(out) for out in outs]
+        for s in session.stream(fn):
+            for writeOne in writers:
+                writeOne(s)
+        if html:
+            tmp.seek(0)
+            body = codecs.getreader('utf-8')(tmp)
+            with HtmlOutput(html) as out:
+                for block in iter(lambda: body.read(1 << 16), u''):
+                    out.f.write(block)
+        for out in outs:
+            out.close()
+    except BaseException:
+        # leave the output files as they were
+        for out in outs:
+            if not out.closed:
+                out.__exit__(*sys.exc_info())
+        raise
+    finally:
+        if tmp:
+            tmp.close()
+    return True
+
+def main(args):
     if args.all or (args.text + args.html + args.xml == 0):
         args.text = args.html = args.xml = True
-    if args.xml and dedup:
-        for s in sessions:
-            ses2idx[s.sessionid] = s.index
-    for mode in ('text', 'html', 'xml'):
+    if args.stream and stream(args):
+        return
+    model = session.read_model(args.infile)
+    for mode in modes:
         if eval('args.' + mode):
-            outfunc = eval('%sOutput' % mode.capitalize())
-            if args.outfile:
-                write(outfunc(args.outfile), sessions)
-            else:
-                try:
-                    write(outfunc(config.get('output files ' + mode, 'schedule')),
-                          sessions)
-                except config.NoOptionError:
-                    pass
+            render(args, model, mode)
@@ -18,12 +18,33 @@
 
 import re
 
-from . import config
+from operator import attrgetter
+
+from . import config, participant, timing
 from .participant import Participant
 from .room import Level, Room
 from .times import Day, Time, Duration
 
+# Registries of track, type and tag names (and tuples of them), like
+# Room.rooms and Level.levels, so all the sessions in a track share one
+# string, and all the sessions with the same tags share one tuple.
+tracks = {}
+types = {}
+tags = {}
+
+def _intern(registry, value):
+    try:
+        return registry[value]
+    except KeyError:
+        registry[value] = value
+        return value
+
 class Session(object):
+    # shorttitle is only set by openclose
+    __slots__ = ('sessionid', '_index', 'time', 'duration', 'room', 'tracks',
+                 'track', 'type', 'tags', 'title', 'description',
+                 'participants', 'moderators', 'moderatorset', 'sortkey',
+                 'shorttitle')
 
     curday = ('', None)
     curtime = ('', None)
@@ -56,13 +77,13 @@ class Session(object):
                 print('info: new day %s' % row['day'])
             day = Day(row['day'])
             Session.curday = (row['day'], day)
-        if row['time'] == Session.curtime[0]:
+        if (row['day'], row['time']) == Session.curtime[0]:
             time = Session.curtime[1]
         else:
             if config.debug:
                 print('info: new time %s' % row['time'])
             time = Time(row['time'], day)
-            Session.curtime = (row['time'], time)
+            Session.curtime = ((row['day'], row['time']), time)
             day.time.append(time)
         self.time = time
         time.sessions.append(self)
@@ -119,15 +140,16 @@ class Session(object):
             Room.rooms[room.index] = room
         self.room = room
         room.sessions.append(self)
+        self._setkey()
 
-        self.tracks = row['tracks']
+        self.tracks = _intern(tracks, tuple([_intern(tracks, t) for t in row['tracks']]))
         try:
             self.track = self.tracks[0]
         except IndexError:
             self.track = None
 
-        self.type = row['type']
-        self.tags = row['tags']
+        self.type = _intern(types, row['type'])
+        self.tags = _intern(tags, tuple([_intern(tags, t) for t in row['tags']]))
         self.title = row['title']
         self.description = row['description']
 
@@ -146,12 +168,15 @@ class Session(object):
         for name in row['moderators']:
             p = participants[name]
             self.moderators.append(p)
+        # for 'p in session.moderatorset' without a list scan
+        self.moderatorset = frozenset(self.moderators)
         if Session.sort_participants:
             if Session.sort_participants == 'yes' or Session.sort_participants == 'strict':
-                self.participants = sorted(self.participants)
+                self.participants = sorted(self.participants, key=participant.sortkey)
             elif Session.sort_participants == 'moderator':
-                self.participants = sorted(self.moderators) + \
-                                    sorted(set(self.participants).difference(self.moderators))
+                self.participants = sorted(self.moderators, key=participant.sortkey) + \
+                                    sorted(set(self.participants).difference(self.moderators),
+                                           key=participant.sortkey)
 
     def _readconfig(self):
         Session._readconfig = lambda x: None
@@ -194,17 +219,26 @@ class Session(object):
         except (config.NoSectionError, config.NoOptionError):
             pass
 
+    def _setkey(self):
+        # Sessions sort by day, time, and then index if they have one,
+        # or room if they don't. The importers number them in that order.
+        self.sortkey = (self.time.day.index, self.time.minutes,
+                        self._index, self.room.index)
+
+    def _setindex(self, index):
+        self._index = index
+        if hasattr(self, 'sortkey'):
+            self._setkey()
+
+    index = property(lambda self: self._index, _setindex)
+
     def __lt__(self, other):
-        return (other and \
-                ((self.time.day < other.time.day) or \
-                 ((self.time.day == other.time.day) and \
-                  ((self.time < other.time) or \
-                   ((self.time == other.time) and \
-                    (((not self.index or not other.index) and \
-                      (self.room < other.room)) or \
-                     (self.index < other.index)))))))
+        return (other and (self.sortkey < other.sortkey))
 
-def read(fn, reset=False):
+# for sorted(sessions, key=sortkey), which is much faster than using __lt__
+sortkey = attrgetter('sortkey')
+
+def importer():
     # Read [participant change name] here because we want to check the
     # chname dict before instantiating the first participant, or even the
     # first session.
@@ -218,10 +252,56 @@ def read(fn, reset=False):
     import importlib
     value = config.get('input file importer', 'reader')
     try:
-        filereader = importlib.import_module(value)
+        return importlib.import_module(value)
     except ImportError:
-        filereader = importlib.import_module('conguide.' + value)
+        return importlib.import_module('conguide.' + value)
+
+def read(fn, reset=False):
+    with timing.stage('import reader'):
+        filereader = importer()
     if reset:
         filereader.sessions = []
         filereader.participants = {}
-    return filereader.read(fn)
+    from . import cache
+    with timing.stage('read'):
+        return cache.read(fn, filereader)
+
+def stream(fn, presorted=None):
+    """ Yield sessions in order, as the file is read, if the importer
+    can do that (see stream() in arisia-csv.py).
+    """
+    filereader = importer()
+    try:
+        stream = filereader.stream
+    except AttributeError:
+        return iter(filereader.read(fn)[0])
+    return stream(fn, presorted)
+
+class Model(object):
+    """ The parsed schedule: sessions, participants, rooms, levels and days,
+    plus participant bios once read_bios() has been called.
+
+    A run builds one Model and hands it to every report writer, so the input
+    files only get parsed once, no matter how many reports are generated.
+    """
+
+    def __init__(self, sessions, participants):
+        self.sessions = sessions
+        self.participants = participants
+        self.rooms = getattr(Room, 'rooms', {})
+        self.levels = getattr(Level, 'levels', {})
+        self.days = Day.days
+        self.bios = None
+
+    def read_bios(self, fn=None):
+        """ Read the bios file into the participants (only once). """
+        if not self.bios:
+            self.bios = fn or config.get('input files', 'bios')
+            with timing.stage('bios'):
+                participant.read(self.bios, self.participants)
+        return self.participants
+
+def read_model(fn=None):
+    """ Read the schedule file, return a Model. """
+    (sessions, participants) = read(fn or config.get('input files', 'schedule'))
+    return Model(sessions, participants)
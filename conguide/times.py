@@ -21,9 +21,105 @@
 
 """ Time and day related classes. """
 
-import copy
-import re
 from functools import total_ordering
+from operator import attrgetter
+
+DIGITS = '0123456789'
+
+def _digits(string, i, most):
+    # index after the run of (at most) most digits starting at string[i]
+    j = i
+    n = min(len(string), i + most)
+    while j < n and string[j] in DIGITS:
+        j += 1
+    return j
+
+def _hhmm(string, ampm):
+    # Parse 'hh:mm' at the start of string, with up to 2 digits in each,
+    # and an optional am/pm after that (with or without a space), if ampm
+    # is set. Anything after that is ignored. Return minutes, or None.
+    i = _digits(string, 0, 3)
+    if i > 2 or string[i:i+1] != ':':
+        return None
+    j = _digits(string, i + 1, 2)
+    # ValueError on ':30' or '4:', same as the regex it replaces
+    hour = int(string[:i])
+    minute = int(string[i+1:j])
+    if ampm:
+        k = j + 1 if string[j:j+1] == ' ' else j
+        suffix = string[k:k+2].upper()
+        if suffix == 'AM' and hour == 12:
+            hour = 0
+        elif suffix == 'PM' and hour != 12:
+            hour += 12
+    return hour * 60 + minute
+
+def parse_clock(string):
+    """ Parse a time of day ('2:30pm', '2:30 PM', '14:30'), return minutes
+    since midnight.
+    """
+    minutes = _hhmm(string, True)
+    if minutes is None:
+        raise ValueError(
+            'invalid initialization string for Time: \'%s\'' % string)
+    return minutes
+
+def parse_duration(string):
+    """ Parse a duration ('2hr 30min', '2hr', '30min', '03:55', '150'),
+    return minutes.
+    """
+    (hour, minute) = split_duration(string)
+    return hour * 60 + minute
+
+def split_duration(string):
+    """ Parse a duration, return (hours, minutes) as written, e.g. (0, 90)
+    for '90min'. Bare minutes are split into hours and minutes.
+    """
+    if not string:
+        return (0, 0)
+    lower = string.lower()
+    hour = minute = None
+
+    # '2hr' or '2 hr' at the start
+    i = _digits(lower, 0, 3)
+    if i <= 2:
+        j = i + 1 if lower[i:i+1] == ' ' else i
+        if lower.startswith('hr', j):
+            hour = int(lower[:i])
+
+    # '30min' or '30 min' anywhere (the first one)
+    k = lower.find('min')
+    if k >= 0:
+        j = k - 1 if k > 0 and lower[k-1] == ' ' else k
+        i = j
+        while i > max(0, j - 2) and lower[i-1] in DIGITS:
+            i -= 1
+        minute = int(lower[i:j])
+
+    if hour or minute:
+        return (hour or 0, minute or 0)
+
+    # maybe this is in time format
+    minutes = _hhmm(string, False)
+    if minutes is not None:
+        return divmod(minutes, 60)
+
+    # '0min', '0hr'
+    if hour is not None or minute is not None:
+        return (0, 0)
+
+    # bare number of minutes
+    digits = string[:-1] if string.endswith('\n') else string
+    if digits and not digits.strip(DIGITS):
+        return divmod(int(digits), 60)
+
+    raise ValueError(
+        'invalid initialization string for Duration: \'%s\'' % string)
+
+# Each distinct string is only parsed once. There are only so many times
+# of day and durations in a schedule.
+_clock = {}
+_duration = {}
 
 @total_ordering
 class Day(object):
@@ -77,6 +173,11 @@ class Day(object):
     def __hash__(self):
         return self.index
 
+    def __setstate__(self, state):
+        # all instances of a day share one __dict__ (see __init__),
+        # so keep it that way when unpickling
+        self.__dict__ = state
+
     def __str__(self):
         return self.name
 
@@ -92,72 +193,88 @@ class Time(object):
         the time and the am/pm string.
     day: Day
         Optional reference to a Day object.
+
+    Internally, a Time is a number of minutes since midnight (which can be
+    24:00 or more, for times after midnight that belong to the previous
+    day), and absolute is that plus the minutes to the start of its day,
+    if it has one. hour and minute are computed from those.
     """
 
+    __slots__ = ('_minutes', '_day', 'absolute', 'sessions')
+
     def __init__(self, string, day=None):
-        m = re.match(r'(\d{,2}):(\d{,2}) ?([AP]M)', string,
-                     flags=re.IGNORECASE)
-        if m:
-            self.hour = int(m.group(1))
-            self.minute = int(m.group(2))
-            ampm = m.group(3).upper()
-            if self.hour == 12:
-                if ampm == 'AM':
-                    self.hour = 0
-            elif ampm == 'PM':
-                self.hour += 12
-        else:
-            # 24-hour time
-            m = re.match(r'(\d{,2}):(\d{,2})', string)
-            if m:
-                self.hour = int(m.group(1))
-                self.minute = int(m.group(2))
-            else:
-                raise ValueError(
-                    'invalid initialization string for Time: \'%s\'' % string)
+        try:
+            minutes = _clock[string]
+        except KeyError:
+            minutes = _clock[string] = parse_clock(string)
         self.sessions = []
-        self.day = day
+        self._set(minutes, day)
+
+    @classmethod
+    def _new(cls, minutes, day=None):
+        # make a Time (or Duration) without parsing a string
+        t = cls.__new__(cls)
+        t.sessions = ()
+        t._set(minutes, day)
+        return t
+
+    def _set(self, minutes, day):
+        self._minutes = minutes
+        self._day = day
+        self.absolute = minutes if day is None else day.index * 24 * 60 + minutes
+
+    def _setday(self, day):
+        self._set(self._minutes, day)
+
+    def _setminutes(self, minutes):
+        self._set(minutes, self._day)
+
+    def _sethour(self, hour):
+        self._set(hour * 60 + self._minutes % 60, self._day)
+
+    def _setminute(self, minute):
+        self._set(self._minutes - self._minutes % 60 + minute, self._day)
+
+    day = property(attrgetter('_day'), _setday)
+    minutes = property(attrgetter('_minutes'), _setminutes)
+    hour = property(lambda self: self._minutes // 60, _sethour)
+    minute = property(lambda self: self._minutes % 60, _setminute)
 
     def __lt__(self, other):
         if not other:
             return False
-        elif self.day and other.day:
-            # Friday 24:00 and Saturday 0:00 should be equal
-            h1 = self.day.index * 24 + self.hour
-            h2 = other.day.index * 24 + other.hour
-            return h1 < h2 or \
-                h1 == h2 and self.minute < other.minute
+        elif self._day is not None and other._day is not None:
+            # Friday 24:00 and Saturday 0:00 are the same
+            return self.absolute < other.absolute
         else:
-            return self.hour < other.hour or \
-                self.hour == other.hour and self.minute < other.minute
+            return self._minutes < other._minutes
 
     def __eq__(self, other):
         if not other:
             return False
-        elif self.day and other.day:
-            h1 = self.day.index * 24 + self.hour
-            h2 = other.day.index * 24 + other.hour
-            return h1 == h2 and self.minute == other.minute
+        elif self._day is not None and other._day is not None:
+            return self.absolute == other.absolute
         else:
-            return self.hour == other.hour and self.minute == other.minute
+            return self._minutes == other._minutes
 
     def __ne__(self, other):
         return not self == other
 
     def __hash__(self):
-        return self.day.index * 24 + self.hour
+        return self.absolute // 60
 
     def __str__(self, mode=None):
+        hour = self._minutes // 60
+        minute = self._minutes % 60
         if mode == '24hr':
-            return '%d:%02d' % (self.hour, self.minute)
+            return '%d:%02d' % (hour, minute)
         else:
-            hour = self.hour
             if hour >= 24:
                 hour -= 24
             if mode == 'grid':
-                if hour == 0 and self.minute == 0:
+                if hour == 0 and minute == 0:
                     return 'midnight'
-                elif hour == 12 and self.minute == 0:
+                elif hour == 12 and minute == 0:
                     return 'noon'
                 else:
                     if hour < 12:
@@ -173,78 +290,52 @@ class Time(object):
                     ampm = 'pm'
             if hour == 0:
                 hour = 12
-            return '%d:%02d%s' % (hour, self.minute, ampm)
+            return '%d:%02d%s' % (hour, minute, ampm)
 
     def __add__(self, other):
         if not isinstance(other, Time):
             raise TypeError('can only add Time or Duration to Time')
-        t = copy.copy(self)
-        t.hour += other.hour
-        t.minute += other.minute
-        if t.minute >= 60:
-            t.hour += 1
-            t.minute -= 60
-        # if time overflows to the next day, normalize it
-        #if t.day:
-        #    if t.hour > 23:
-        #        t.hour -= 24
-        #        t.day = Day.days[t.day.index + 1]
-        return t
+        return self._new(self._minutes + other._minutes, self._day)
 
     def __sub__(self, other):
         if not isinstance(other, Time):
             raise TypeError('can only subtract Time or Duration from Time')
-        t = copy.copy(self)
-        t.hour -= other.hour
-        t.minute -= other.minute
-        if t.minute >= 60:
-            t.hour -= 1
-            t.minute += 60
-        return t
+        return self._new(self._minutes - other._minutes, self._day)
 
 class Duration(Time):
     """ Duration class. Internally, a Duration is identical to a Time,
     but the initialization and presentation strings are different.
+    It prints the way it was written, e.g. '90min' rather than '1hr 30min'.
 
     Parameters:
 
     string: str
         Can be of the form '2hr 30min', or an absolute number of minutes (150).
     """
+
+    __slots__ = ('_split',)
+
     def __init__(self, string):
-        self.day = None
-        self.hour = self.minute = 0
-        if not string:
-            return
-        m = re.match(r'(\d{,2}) ?hr', string, flags=re.IGNORECASE)
-        if m:
-            self.hour = int(m.group(1))
-        m = re.search(r'(\d{,2}) ?min', string, flags=re.IGNORECASE)
-        if m:
-            self.minute = int(m.group(1))
-        if self.hour == 0 and self.minute == 0:
-            # maybe this is in time format
-            m = re.match(r'(\d{,2}):(\d{,2})', string)
-            if m:
-                self.hour = int(m.group(1))
-                self.minute = int(m.group(2))
-            else:
-                # bare number of minutes
-                m = re.match(r'^(\d+)$', string)
-                if m:
-                    (self.hour, self.minute) = divmod(int(m.group(1)), 60)
-                else:
-                    raise ValueError(
-                        'invalid initialization string for Duration: ' +
-                        '\'%s\'' % string)
+        self.sessions = ()
+        try:
+            split = _duration[string]
+        except KeyError:
+            split = _duration[string] = split_duration(string)
+        self._set(split[0] * 60 + split[1], None)
+        self._split = split
+
+    def _set(self, minutes, day):
+        Time._set(self, minutes, day)
+        self._split = divmod(minutes, 60)
 
     def __str__(self):
-        if not self.minute:
-            return '%dhr' % self.hour
-        elif not self.hour:
-            return '%dmin' % self.minute
+        (hour, minute) = self._split
+        if not minute:
+            return '%dhr' % hour
+        elif not hour:
+            return '%dmin' % minute
         else:
-            return '%dhr %dmin' % (self.hour, self.minute)
+            return '%dhr %dmin' % (hour, minute)
 
 if __name__ == '__main__':
 
@@ -254,6 +345,7 @@ if __name__ == '__main__':
             "Duration('3hr 55min')", \
             "Duration('03:55')", \
             "Duration('235')", \
+            "Duration('90min')", \
             "Time('4:45 PM') + Duration('1hr 15min')", \
             "Time('11:30 PM') + Duration('6hr')", \
             "Time('6:00am') > Time('6:00pm')", \
@@ -262,3 +354,53 @@ if __name__ == '__main__':
 
     for a in test:
         print('%s = %s' % (a, eval(a)))
+
+    # every accepted format, in minutes
+    clock = [('4:15 PM', 975), ('4:15pm', 975), ('4:15 pm', 975),
+             ('4:15PM', 975), ('12:00 AM', 0), ('12:30am', 30),
+             ('12:30 PM', 750), ('11:59 PM', 1439), ('16:15', 975),
+             ('06:00', 360), ('6:0', 360), ('24:30', 1470)]
+    duration = [('3hr 55min', 235), ('3 hr 55 min', 235), ('1HR 15MIN', 75),
+                ('2hr', 120), ('30min', 30), ('45 minutes', 45),
+                ('03:55', 235), ('3:55', 235), ('235', 235), ('0', 0),
+                ('0min', 0), ('', 0)]
+    # how each one prints
+    display = [('3hr 55min', '3hr 55min'), ('90min', '90min'), ('2hr', '2hr'),
+               ('03:55', '3hr 55min'), ('235', '3hr 55min'), ('0', '0hr')]
+    bad_clock = ['noon', '4 PM', '123:00', '']
+    bad_duration = ['soon', '1 hour', '-30']
+
+    failed = 0
+    for (parse, table) in ((parse_clock, clock), (parse_duration, duration)):
+        for (string, minutes) in table:
+            if parse(string) != minutes:
+                print('FAIL: %s(%r) = %r, not %r' % \
+                      (parse.__name__, string, parse(string), minutes))
+                failed += 1
+    for (string, text) in display:
+        if str(Duration(string)) != text:
+            print('FAIL: str(Duration(%r)) = %r, not %r' % \
+                  (string, str(Duration(string)), text))
+            failed += 1
+    for (parse, table) in ((parse_clock, bad_clock), (parse_duration, bad_duration)):
+        for string in table:
+            try:
+                parse(string)
+            except ValueError:
+                continue
+            print('FAIL: %s(%r) should raise ValueError' % (parse.__name__, string))
+            failed += 1
+    print('%d parse tests, %d failed' % \
+          (len(clock) + len(duration) + len(display) + len(bad_clock) +
+           len(bad_duration), failed))
+
+    # microbenchmark: parsing, and construction with the memo
+    import timeit
+    setup = 'from __main__ import Time, Duration, parse_clock, parse_duration'
+    for stmt in ("parse_clock('4:15 PM')", "Time('4:15 PM')",
+                 "parse_duration('1hr 15min')", "Duration('1hr 15min')"):
+        t = min(timeit.repeat(stmt, setup, number=100000, repeat=3))
+        print('%-28s %.2f usec' % (stmt, t * 10))
+
+    import sys
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" Wall and CPU time for the stages of a run, for --profile.
+
+A stage is a block of code run under 'with stage(name)'. Stages nest, and
+each one is recorded with its path (the names of the stages it's in), so
+they can be printed as an indented table, or written out as collapsed
+stacks for flamegraph.pl and the like. Recording is cheap, so it's always
+on; --profile only controls whether the results get printed.
+"""
+
+import contextlib
+import os
+import time
+
+# (start, path, wall, cpu) for each stage, in the order they ended
+records = []
+
+# the names of the stages we're in now
+stack = []
+
+def cpu():
+    # user + system time of this process (not its children)
+    t = os.times()
+    return t[0] + t[1]
+
+@contextlib.contextmanager
+def stage(name):
+    """ Time a block of code as a stage. """
+    stack.append(name)
+    path = tuple(stack)
+    (start, cstart) = (time.time(), cpu())
+    try:
+        yield
+    finally:
+        records.append((start, path, time.time() - start, cpu() - cstart))
+        stack.pop()
+
+def timed(report):
+    """ Decorate a report's render(args, model, mode), so each output mode
+    is timed as a stage.
+    """
+    def decorate(render):
+        def timed_render(args, model, mode):
+            with stage('%s %s' % (report, mode)):
+                return render(args, model, mode)
+        timed_render.__doc__ = render.__doc__
+        return timed_render
+    return decorate
+
+def mark():
+    """ Return a mark for since(), e.g. at the start of a job in a worker. """
+    return (len(records), len(stack))
+
+def since(mark):
+    """ Return the stages recorded since mark, relative to the stage that
+    was current then, to pass to adopt() in the parent process.
+    """
+    (n, depth) = mark
+    return [(start, path[depth:], wall, t) for (start, path, wall, t) in records[n:]]
+
+def adopt(stages):
+    """ Record stages from since() in another process, as part of the
+    current stage.
+    """
+    prefix = tuple(stack)
+    for (start, path, wall, t) in stages:
+        records.append((start, prefix + path, wall, t))
+
+def report(f, total):
+    """ Print the stages in the order they started, indented by depth. """
+    f.write('%-8s%8s %7s  %s\n' % ('profile:', 'wall', 'cpu', 'stage'))
+    for (start, path, wall, t) in sorted(records, key=lambda r: (r[0], len(r[1]))):
+        f.write('%16.3f %7.3f  %s%s\n' % (wall, t, '  ' * (len(path) - 1), path[-1]))
+    (wall, t) = total
+    f.write('%16.3f %7.3f  total\n' % (wall, t))
+
+def stacks(f, root, total):
+    """ Write the stages as collapsed stacks ('a;b;c microseconds'), each
+    with its own (self) wall time, for flamegraph tools.
+    """
+    walls = {}
+    for (start, path, wall, t) in records:
+        walls[path] = walls.get(path, 0.0) + wall
+    inner = {}
+    for (path, wall) in walls.items():
+        inner[path[:-1]] = inner.get(path[:-1], 0.0) + wall
+    own = {(): total - inner.get((), 0.0)}
+    for (path, wall) in walls.items():
+        own[path] = wall - inner.get(path, 0.0)
+    for path in sorted(own):
+        usec = int(round(max(own[path], 0.0) * 1e6))
+        if usec:
+            f.write('%s %d\n' % (';'.join((root,) + path), usec))
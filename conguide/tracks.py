@@ -19,8 +19,8 @@
 import copy
 import re
 
-from . import parserhelp, config, output, session
-from .room import Room
+from . import parserhelp, config, output, session, timing
+from .classifier import Classifier
 
 class Output(output.Output):
 
@@ -36,17 +36,7 @@ class Output(output.Output):
                 Output.template[key] = self.parseTemplate(value)
         except config.NoSectionError:
             pass
-        Output.classifiers = []
-        try:
-            for area, expr in config.items('tracks classifier'):
-                expr = expr.replace('track', 'session.track')
-                expr = expr.replace('type', 'session.type')
-                expr = re.sub(r'room == (\'\w+\')',
-                              r'session.room == Room.rooms[\1]', expr)
-                area = area.replace(' - ', u'\u2014')
-                Output.classifiers.append((area, expr))
-        except config.NoSectionError:
-            pass
+        Output.classifier = classifier()
         try:
             val = config.get('tracks title prune', 'title starts with')
             val = re.sub(r'\'', '', val)
@@ -136,9 +126,9 @@ class HtmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</dl></body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -177,10 +167,9 @@ class XmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</tracks>\n')
-        if not self.leaveopen:
-            Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -201,14 +190,19 @@ class XmlOutput(Output):
     def markupTitle(self, session, text):
         return '<tr-title>%s</tr-title>' % text if text else ''
 
+def classifier():
+    # [tracks classifier], with ' - ' in the area names made into m-dashes
+    try:
+        rules = config.items('tracks classifier')
+    except config.NoSectionError:
+        rules = []
+    return Classifier([(area.replace(' - ', u'\u2014'), expr)
+                       for (area, expr) in rules])
+
 def write(output, sessions):
     tracks = {}
     for session in sessions:
-        t = session.track
-        for k, v in Output.classifiers:
-            if eval(v):
-                t = k
-                break
+        t = Output.classifier(session, session.track)
         if config.debug:
             print('%s: %s' % (t, session.title))
         try:
@@ -228,19 +222,27 @@ def add_args(subparsers):
     parserhelp.add_io(parser)
     parser.set_defaults(func=main)
 
+# output modes supported by this report
+modes = ('text', 'html', 'xml')
+
+@timing.timed('tracks')
+def render(args, model, mode):
+    """ Write one output mode of the track list. """
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.sessions)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'tracks')) as out:
+                write(out, model.sessions)
+        except config.NoOptionError:
+            pass
+
 def main(args):
-    fn = args.infile or config.get('input files', 'schedule')
-    (sessions, participants) = session.read(fn)
+    model = session.read_model(args.infile)
     if args.all or (args.text + args.html + args.xml == 0):
         args.text = args.html = args.xml = True
-    for mode in ('text', 'html', 'xml'):
+    for mode in modes:
         if eval('args.' + mode):
-            outfunc = eval('%sOutput' % mode.capitalize())
-            if args.outfile:
-                write(outfunc(args.outfile), sessions)
-            else:
-                try:
-                    write(outfunc(config.get('output files ' + mode, 'tracks')),
-                          sessions)
-                except config.NoOptionError:
-                    pass
+            render(args, model, mode)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014-2017, Paul Selkirk
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR
+# PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+""" Rebuild all reports whenever the input or config files change.
+
+This imports everything and parses the config file once, then polls the
+schedule, bios and config files. When one of them changes, it forks a
+child to do what 'all --incremental' does: read the schedule (from the
+snapshot cache, if it was the bios file that changed), and re-render only
+the reports whose sessions or participants changed. Each build starts from
+a clean model, without paying for interpreter startup and imports.
+
+Without fork (i.e. on Windows), each build is a new 'conguide all' process.
+"""
+
+import os
+import subprocess
+import sys
+import time
+import traceback
+
+from . import config, parserhelp
+
+def prepare():
+    """ Do everything a build needs that doesn't depend on the input files. """
+    from . import conguide, session
+    config.load()
+    for name in conguide.reports:
+        conguide.module(name)
+    for name in ('cache', 'incremental'):
+        conguide.module(name)
+    session.importer()
+
+def files(args):
+    """ Return the files to watch. """
+    fns = [config.cfgfile, args.infile or config.get('input files', 'schedule')]
+    try:
+        fns.append(config.get('input files', 'bios'))
+    except (config.NoSectionError, config.NoOptionError):
+        pass
+    return fns
+
+def stat(fn):
+    # enough to tell if a file has changed; None if it's missing
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def command_line(args):
+    # the 'all' command line for this watch, for builds without fork
+    cmd = [sys.executable, '-m', 'conguide.conguide', '-c', config.cfgfile]
+    if config.debug:
+        cmd.append('--debug')
+    if config.quiet:
+        cmd.append('--quiet')
+    if not config.cache:
+        cmd.append('--no-cache')
+    cmd += ['all', '--incremental', '--jobs', str(args.jobs)]
+    for mode in ('text', 'html', 'xml', 'indesign', 'all'):
+        if getattr(args, mode):
+            cmd.append('--' + mode)
+    for opt in ('infile', 'outfile'):
+        if getattr(args, opt):
+            cmd += ['--' + opt, getattr(args, opt)]
+    return cmd
+
+def build(args):
+    """ Run one incremental build in a child process; return True if it
+    succeeded.
+    """
+    fn = args.infile or config.get('input files', 'schedule')
+    config.source_date = time.ctime(os.path.getmtime(fn))
+    if not hasattr(os, 'fork'):
+        return subprocess.call(command_line(args)) == 0
+
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            from .conguide import all_reports
+            all_reports(args)
+            status = 0
+        except SystemExit as e:
+            # e.g. a report failed, and nothing was written
+            if e.code:
+                sys.stderr.write('%s\n' % e.code)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+    (pid, status) = os.waitpid(pid, 0)
+    return status == 0
+
+def watch(args):
+    prepare()
+    seen = {}
+    while True:
+        fns = files(args)
+        current = dict([(fn, stat(fn)) for fn in fns])
+        if current != seen:
+            # let the files settle, in case one is still being written
+            time.sleep(args.interval)
+            if dict([(fn, stat(fn)) for fn in fns]) != current:
+                continue
+            changed = [fn for fn in fns if seen.get(fn) != current[fn]]
+            if seen and config.cfgfile in changed:
+                config.reset()
+                prepare()
+            if seen and not config.quiet:
+                print('watch: %s changed' % ', '.join(changed))
+            start = time.time()
+            ok = build(args)
+            if not config.quiet:
+                print('watch: %s in %.2fs' % \
+                      ('built' if ok else 'build failed', time.time() - start))
+            sys.stdout.flush()
+            seen = current
+        time.sleep(args.interval)
+
+def add_args(subparsers):
+    parser = subparsers.add_parser('watch', add_help=False,
+                                   help='rebuild all reports whenever the input files change')
+    parserhelp.add_modes(parser, ['t', 'h', 'x', 'i', 'a'])
+    parserhelp.add_io(parser)
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                        metavar='N',
+                        help='render reports in N parallel processes')
+    parser.add_argument('--interval', action='store', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help='how often to check the files (default 1)')
+    parser.set_defaults(func=main)
+
+def main(args):
+    args.incremental = True
+    try:
+        watch(args)
+    except KeyboardInterrupt:
+        pass
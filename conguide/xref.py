@@ -19,7 +19,7 @@
 import copy
 import re
 
-from . import parserhelp, config, output, session
+from . import parserhelp, config, output, participant, session, timing
 
 class Output(output.Output):
 
@@ -87,9 +87,9 @@ class HtmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</body></html>\n')
-        Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -125,10 +125,9 @@ class XmlOutput(Output):
         except config.NoSectionError:
             pass
 
-    def __del__(self):
+    def close(self):
         self.f.write('</xrefs>\n')
-        if not self.leaveopen:
-            Output.__del__(self)
+        Output.close(self)
 
     def cleanup(self, text):
         # convert ampersand
@@ -145,7 +144,7 @@ class XmlOutput(Output):
 
 def write(output, participants):
 
-    for p in sorted(participants.values()):
+    for p in sorted(participants.values(), key=participant.sortkey):
         if p.sessions:
             output.f.write(output.strXref(p))
 
@@ -156,19 +155,27 @@ def add_args(subparsers):
     parserhelp.add_io(parser)
     parser.set_defaults(func=main)
 
+# output modes supported by this report
+modes = ('text', 'html', 'xml')
+
+@timing.timed('xref')
+def render(args, model, mode):
+    """ Write one output mode of the program participant cross-reference. """
+    outfunc = eval('%sOutput' % mode.capitalize())
+    if args.outfile:
+        with outfunc(args.outfile) as out:
+            write(out, model.participants)
+    else:
+        try:
+            with outfunc(config.get('output files ' + mode, 'xref')) as out:
+                write(out, model.participants)
+        except config.NoOptionError:
+            pass
+
 def main(args):
-    fn = args.infile or config.get('input files', 'schedule')
-    (sessions, participants) = session.read(fn)
+    model = session.read_model(args.infile)
     if args.all or (args.text + args.html + args.xml == 0):
         args.text = args.html = args.xml = True
-    for mode in ('text', 'html', 'xml'):
+    for mode in modes:
         if eval('args.' + mode):
-            outfunc = eval('%sOutput' % mode.capitalize())
-            if args.outfile:
-                write(outfunc(args.outfile), participants)
-            else:
-                try:
-                    write(outfunc(config.get('output files ' + mode, 'xref')),
-                          participants)
-                except config.NoOptionError:
-                    pass
+            render(args, model, mode)